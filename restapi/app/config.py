@@ -6,3 +6,31 @@ DEFAULT_DATASET = os.path.join(os.path.dirname(__file__), "benchmarkdataset.csv"
 EXTERNAL_CQ_GENERATION_URL = os.getenv("EXTERNAL_CQ_GENERATION_URL", "http://127.0.0.1:8001/newapi") #e.g., your personal url
 HEATMAP_OUTPUT_FOLDER = os.getenv("HEATMAP_OUTPUT_FOLDER", "heatmaps")
 RESULTS_DIR = os.getenv("RESULTS_DIR", "results")
+BERTSCORE_MODEL = os.getenv("BERTSCORE_MODEL", "microsoft/deberta-xlarge-mnli")
+BERTSCORE_BATCH_SIZE = int(os.getenv("BERTSCORE_BATCH_SIZE", "64"))
+BERTSCORE_CACHE_BYTES = int(os.getenv("BERTSCORE_CACHE_BYTES", str(512 * 1024 * 1024)))
+SBERT_MODEL = os.getenv("SBERT_MODEL", "all-MiniLM-L6-v2")
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "false").lower() in ("1", "true", "yes")
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "embedding_store")
+EMBEDDING_CACHE_BYTES = int(os.getenv("EMBEDDING_CACHE_BYTES", str(256 * 1024 * 1024)))
+EMBEDDING_CACHE_FLOAT16 = os.getenv("EMBEDDING_CACHE_FLOAT16", "false").lower() in ("1", "true", "yes")
+PAIR_SCORE_CACHE_PATH = os.getenv("PAIR_SCORE_CACHE_PATH", "pair_score_cache.sqlite3")
+VALIDATION_WORKERS = int(os.getenv("VALIDATION_WORKERS", "1"))
+VALIDATION_MEMORY_BYTES = int(os.getenv("VALIDATION_MEMORY_BYTES", str(8 * 1024 ** 3)))  # budget of all worker processes
+BERTSCORE_WORKER_BYTES = int(os.getenv("BERTSCORE_WORKER_BYTES", str(3 * 1024 ** 3)))  # BERTScore model in one worker
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))  # per provider; LLM_MAX_CONCURRENCY_<PROVIDER> overrides
+HEATMAP_MODE = os.getenv("HEATMAP_MODE", "background")  # background | sync | on_demand
+HEATMAP_RENDER_WORKERS = int(os.getenv("HEATMAP_RENDER_WORKERS", "2"))
+HEATMAP_ANNOTATE_MAX_CELLS = int(os.getenv("HEATMAP_ANNOTATE_MAX_CELLS", "400"))
+HEATMAP_MAX_SIDE = int(os.getenv("HEATMAP_MAX_SIDE", "512"))
+HEATMAP_FOLDER_MAX_BYTES = int(os.getenv("HEATMAP_FOLDER_MAX_BYTES", "0"))  # 0 = unlimited
+VALIDATION_JOB_WORKERS = int(os.getenv("VALIDATION_JOB_WORKERS", "2"))
+VALIDATION_JOB_HISTORY = int(os.getenv("VALIDATION_JOB_HISTORY", "100"))
+RESULTS_FSYNC_EVERY = int(os.getenv("RESULTS_FSYNC_EVERY", "50"))  # rows between fsyncs of the results CSV, 0 = on close only
+SIMILARITY_BLOCK_BYTES = int(os.getenv("SIMILARITY_BLOCK_BYTES", str(64 * 1024 * 1024)))  # per similarity tile in best-match searches
+ANN_INDEX_ENABLED = os.getenv("ANN_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+ANN_INDEX_DIR = os.getenv("ANN_INDEX_DIR", "ann_index")
+ANN_MIN_GOLD = int(os.getenv("ANN_MIN_GOLD", "5000"))  # smaller benchmarks are searched exactly
+ANN_N_PROBE = int(os.getenv("ANN_N_PROBE", "8"))
+ANN_MIN_RECALL = float(os.getenv("ANN_MIN_RECALL", "0.95"))
+ANN_RECALL_SAMPLE = int(os.getenv("ANN_RECALL_SAMPLE", "256"))
@@ -1,11 +1,29 @@
 # app/main.py
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from app.routers import cq_validation
+from app.config import PRELOAD_MODELS
+from app.services.model_registry import preload_models
+from app.services.heatmap_renderer import shutdown_heatmap_renderer
+from app.services.job_manager import shutdown_job_manager
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the shared models once per worker instead of on the first request
+    if PRELOAD_MODELS:
+        preload_models()
+    yield
+    shutdown_job_manager()
+    shutdown_heatmap_renderer()
+
 
 app = FastAPI(
     title="CQ Verification and Generation API",
     description="APIs for competency question validation and generation",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Include routers with prefixes and tags
@@ -1,19 +1,50 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
 import pandas as pd
-from io import StringIO
-import os, time, math, json, csv, re
+import numpy as np
+from io import StringIO, BytesIO
+import os, time, math, json, csv, re, uuid
 import logging
+from typing import Iterator
 
 from app.services.cq_validator import CQValidator
+from app.services.metric_registry import plan_validation, summary_columns, result_columns
+from app.services.parallel_validation import validate_rows
 from app.services.hit_rate_evaluator import HitRateEvaluator
+from app.services.embedding_store import get_embedding_cache
+from app.services.bertscore import token_cache_stats
+from app.services.pair_score_cache import get_pair_score_cache
+from app.services.heatmap_renderer import HEATMAP_MODES, ensure_heatmap
+from app.services.job_manager import get_job_manager
+from app.services.matrix_store import (MATRICES_KEY, MatrixStoreWriter, load_run_matrices, run_matrices_folder,
+                                       save_bench_best_match)
+from app.services.threshold_sweep import sweep_run, threshold_grid
 from app.utils.external_call import call_external_cq_generation_service
-from app.config import DEFAULT_DATASET, RESULTS_DIR
+from app.utils.results_writer import ResultsCSVWriter, ROW_HASH_COLUMN, row_hash, completed_results
+from app.config import DEFAULT_DATASET, RESULTS_DIR, HEATMAP_OUTPUT_FOLDER, RESULTS_FSYNC_EVERY
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+class CQGenerationError(Exception):
+    """The external CQ generation service failed."""
+
+
+# Run ids: millisecond timestamp plus a random suffix (older runs: a whole-second timestamp)
+_RUN_ID_PATTERN = r"\d+(?:-[0-9a-f]{8})?"
+
+
+def _new_run_id() -> str:
+    """Unique id of a new run, so runs started at the same moment never share files."""
+    return f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+
+
+def _valid_run_id(run_id: str) -> bool:
+    return re.fullmatch(_RUN_ID_PATTERN, run_id) is not None
+
+
 def clean_nans(obj):
     if isinstance(obj, list):
         return [clean_nans(o) for o in obj]
@@ -28,14 +59,14 @@ def _write_results_csv(results: list, path: str) -> None:
     if not results:
         return
     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-    keys = list({k for r in results for k in r.keys()})
+    keys = list(dict.fromkeys(k for r in results for k in r.keys()))
     with open(path, mode="w", newline="", encoding="utf-8") as f:
         writer = csv.DictWriter(f, fieldnames=keys)
         writer.writeheader()
         writer.writerows(results)
 
 
-def _run_validation_pipeline(
+def _iter_validation_pipeline(
     df: pd.DataFrame,
     gold_col: str,
     output_folder: str,
@@ -45,57 +76,129 @@ def _run_validation_pipeline(
     save_every: int,
     evaluator_llm: str,
     tool_llm: str,
-) -> dict:
-    validator = CQValidator(output_folder=output_folder, model=model, validation_mode=validation_mode)
+    metrics: list = None,
+    workers: int = None,
+    heatmap_mode: str = None,
+    resume_run_id: str = None,
+    save_matrices: bool = True,
+    generation: dict = None,
+) -> Iterator[dict]:
+    """Run the validation pipeline, yielding one record per event as soon as it is available.
+
+    Records have a ``type``: ``generation`` (external CQ generation started
+    and done, when the input has no generated CQs), ``row`` (one validated
+    row, in input order), ``aggregate`` (per-project summaries, when results
+    are saved), ``hit_rate`` and finally ``done`` with the paths of the saved
+    files.
+
+    With ``resume_run_id`` the run continues that earlier run's files: rows
+    already in its results CSV (same gold, generated, mode, model and metrics,
+    no error) are taken from there instead of being validated again, and are
+    flagged ``resumed`` in their records. Its error rows are dropped from the
+    file, as those rows are validated again.
+
+    With ``save_results`` and ``save_matrices`` every row's similarity matrices
+    also go to the run's matrix store (see ``app.services.matrix_store``).
+
+    ``generation`` (keyword arguments of ``call_external_cq_generation_service``)
+    first fills the ``generated`` column from the external service, on the
+    thread consuming the records; a failure raises ``CQGenerationError``.
+    """
+    if generation:
+        yield {"type": "generation", "status": "started", "total": len(df)}
+        started = time.time()
+        try:
+            df = call_external_cq_generation_service(df, **generation)
+        except Exception as e:
+            raise CQGenerationError(f"Error calling external CQ generation service: {e}") from e
+        yield {"type": "generation", "status": "done", "total": len(df),
+               "elapsed_s": round(time.time() - started, 1)}
+    save_matrices = bool(save_results and save_matrices)
+    validator = CQValidator(output_folder=output_folder, model=model, validation_mode=validation_mode,
+                            metrics=metrics, heatmap_mode=heatmap_mode, keep_matrices=save_matrices)
     results = []
     save_interval = save_every if save_every and save_every > 0 else None
-    timestamp = int(time.time())
-    results_file = ""
+    run_id = resume_run_id or _new_run_id()
+    results_file = os.path.join(RESULTS_DIR, f"validation_results_{run_id}.csv") if save_results else ""
     projects_dir = ""
 
-    if save_results:
-        os.makedirs(RESULTS_DIR, exist_ok=True)
-        results_file = os.path.join(RESULTS_DIR, f"validation_results_{timestamp}.csv")
+    completed = {}
+    if resume_run_id:
+        resume_file = os.path.join(RESULTS_DIR, f"validation_results_{resume_run_id}.csv")
+        completed = completed_results(resume_file)
+        logger.info("Resuming run %s: %s completed rows in %s", resume_run_id, len(completed), resume_file)
 
     project_col = "Project Name" if "Project Name" in df.columns else None
 
+    writer = None
+    if save_results:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        columns = ["Gold Standard", "Generated"] + (["Project Name"] if project_col else [])
+        writer = ResultsCSVWriter(results_file,
+                                  columns + result_columns(validator.plan) + ["Error", ROW_HASH_COLUMN],
+                                  fsync_every=RESULTS_FSYNC_EVERY, append=bool(resume_run_id),
+                                  drop_failed=True)
+    matrix_writer = MatrixStoreWriter(run_matrices_folder(run_id), append=bool(resume_run_id)) \
+        if save_matrices else None
+    unsaved = []
+
     total_rows = len(df)
     pipeline_start = time.time()
-    for idx, row in df.iterrows():
-        base = {"Gold Standard": row[gold_col], "Generated": row["generated"]}
-        if project_col:
-            base["Project Name"] = row[project_col]
-        t0 = time.time()
-        try:
-            result = validator.validate(row[gold_col], row["generated"])
-            results.append({**base, **result})
-        except Exception as e:
-            results.append({**base, "Error": str(e)})
-        elapsed = time.time() - t0
-        done = idx + 1
-        avg = (time.time() - pipeline_start) / done
-        remaining = avg * (total_rows - done)
-        logger.info("Validated row %s/%s in %.1fs | avg %.1fs | est. remaining %.0fm%.0fs",
-                    done, total_rows, elapsed, avg, remaining // 60, remaining % 60)
-
-        if save_results and save_interval and len(results) % save_interval == 0:
-            _write_results_csv(results, results_file)
-            logger.info("Incremental save after %s rows → %s", len(results), results_file)
+    rows = [(row[gold_col], row["generated"]) for _, row in df.iterrows()]
+    keys = [row_hash(gold, generated, validation_mode, model, metrics) for gold, generated in rows]
+    todo = [row for row, key in zip(rows, keys) if key not in completed]
+    outcomes = validate_rows(validator, todo, workers=workers)
+    last = pipeline_start
+    validated = 0
+    try:
+        for done, ((_, row), key) in enumerate(zip(df.iterrows(), keys), start=1):
+            base = {"Gold Standard": row[gold_col], "Generated": row["generated"]}
+            if project_col:
+                base["Project Name"] = row[project_col]
+            resumed = key in completed
+            if resumed:
+                results.append({**completed[key], **base})
+            else:
+                result = next(outcomes)
+                kept = result.pop(MATRICES_KEY, None)
+                if matrix_writer is not None and kept is not None:
+                    matrix_writer.add(done - 1, kept["generated"], kept["gold"], kept["matrices"],
+                                      project=str(base["Project Name"]) if project_col else None, row_hash=key)
+                results.append({**base, **result})
+                unsaved.append({**results[-1], ROW_HASH_COLUMN: key})
+                validated += 1
+                now = time.time()
+                elapsed, last = now - last, now
+            avg = (time.time() - pipeline_start) / validated if validated else 0.0
+            remaining = avg * (len(todo) - validated)
+            if not resumed:
+                logger.info("Validated row %s/%s in %.1fs | avg %.1fs | est. remaining %.0fm%.0fs",
+                            done, total_rows, elapsed, avg, remaining // 60, remaining % 60)
+
+            if writer is not None and save_interval and len(unsaved) >= save_interval:
+                writer.write_rows(unsaved)
+                unsaved = []
+                logger.info("Incremental save after %s rows → %s", len(results), results_file)
+            record = {"type": "row", "row": done, "total": total_rows, "eta_s": round(remaining, 1),
+                      "result": clean_nans(results[-1])}
+            yield {**record, "resumed": True} if resumed else record
+    finally:
+        outcomes.close()
+        # Also on early exit (cancelled job, closed stream): keep every finished row
+        if writer is not None:
+            writer.write_rows(unsaved)
+            writer.close()
+        if matrix_writer is not None:
+            matrix_writer.close()
 
+    logger.info("Embedding cache after %s rows: %s", total_rows, get_embedding_cache().stats())
+
+    grouped = None
     if save_results:
-        _write_results_csv(results, results_file)
 
         # Save one summary CSV with one row per project
         if project_col and results:
-            _NUMERIC_COLS = [
-                "Average Cosine Similarity", "Max Cosine Similarity",
-                "Average BERTScore-F1", "Max BERTScore-F1",
-                "Average BERTScore-Precision", "Average BERTScore-Recall",
-                "Average BLEU", "Max BLEU",
-                "Average ROUGE-L F1", "Max ROUGE-L F1",
-                "Average Jaccard Similarity",
-                "Precision@0.6", "Matches@0.6",
-            ]
+            _NUMERIC_COLS = summary_columns(validator.plan["report"])
             project_buckets: dict = {}
             for r in results:
                 pname = str(r.get("Project Name", "unknown")).strip() or "unknown"
@@ -107,7 +210,7 @@ def _run_validation_pipeline(
                     vals = [r[col] for r in rows if isinstance(r.get(col), (int, float)) and r[col] == r[col]]
                     row_out[col] = round(sum(vals) / len(vals), 4) if vals else None
                 summary_rows.append(row_out)
-            projects_dir = os.path.join(RESULTS_DIR, f"scores_by_project_{timestamp}.csv")
+            projects_dir = os.path.join(RESULTS_DIR, f"scores_by_project_{run_id}.csv")
             _write_results_csv(summary_rows, projects_dir)
             logger.info("Per-project summary CSV saved to %s", projects_dir)
 
@@ -115,38 +218,45 @@ def _run_validation_pipeline(
             grouped = validator.aggregate_dataframe_metrics(
                 df, gold_col=gold_col, generated_col="generated",
                 link_cols=["Link"],
-                output_ontologies_folder=os.path.join(RESULTS_DIR, f"downloaded_ontologies_{timestamp}"),
+                output_ontologies_folder=os.path.join(RESULTS_DIR, f"downloaded_ontologies_{run_id}"),
                 precision_threshold=0.6,
                 compute_pairwise_metrics=True,
             )
-            with open(os.path.join(RESULTS_DIR, f"validation_grouped_{timestamp}.json"), "w", encoding="utf-8") as gf:
+            with open(os.path.join(RESULTS_DIR, f"validation_grouped_{run_id}.json"), "w", encoding="utf-8") as gf:
                 json.dump(grouped, gf, ensure_ascii=False, indent=2)
+            logger.info("Aggregation reused row-stage pair scores: %s", validator.run_store.stats())
         except Exception as e:
             logger.warning("Aggregate metrics failed: %s", e)
+        yield {"type": "aggregate", "per_project_scores": projects_dir or "Not saved",
+               "grouped": clean_nans(grouped) if grouped is not None else None}
 
     # Hit Rate metric
     hit_rate_result = {}
     try:
-        def split_cqs(text: str) -> list:
-            return [q.strip() + "?" for q in re.split(r"\?", str(text)) if q.strip()]
-
         bench_cqs, tool_cqs = [], []
         for _, row in df.iterrows():
-            bench_cqs.extend(split_cqs(row[gold_col]))
-            tool_cqs.extend(split_cqs(row["generated"]))
+            bench_cqs.extend(validator.split_cqs(row[gold_col]))
+            tool_cqs.extend(validator.split_cqs(row["generated"]))
 
         context_cols = [c for c in df.columns if c in ("Scenario", "Description")]
         scenario_context = " ".join(
             str(df[col].dropna().iloc[0]) for col in context_cols if not df[col].dropna().empty
         ) or "No scenario context provided."
 
-        hit_rate_result = HitRateEvaluator(threshold=0.6, k=3).compute(
+        # Reuse the embeddings of the cosine metric (cache hits) instead of re-encoding
+        reuse = "cosine" in validator.plan["compute"]
+        evaluator = HitRateEvaluator(threshold=0.6, k=3)
+        hit_rate_result = evaluator.compute(
             bench_cqs=bench_cqs,
             tool_cqs=tool_cqs,
             scenario_context=scenario_context,
             evaluator_llm=evaluator_llm,
             tool_llm=tool_llm,
+            bench_embeddings=validator._encode_with_cache(bench_cqs) if reuse and bench_cqs else None,
+            tool_embeddings=validator._encode_with_cache(tool_cqs) if reuse and tool_cqs else None,
         )
+        if save_matrices and evaluator.best_per_bench is not None:
+            save_bench_best_match(run_matrices_folder(run_id), evaluator.best_per_bench)
     except Exception as e:
         hit_rate_result = {"error": str(e)}
 
@@ -160,18 +270,89 @@ def _run_validation_pipeline(
             logger.info("Hit rate saved to %s", hit_rate_path)
         except Exception as e:
             logger.warning("Could not save hit rate to disk: %s", e)
+    yield {"type": "hit_rate", "hit_rate": clean_nans(hit_rate_result)}
 
-    return {
+    yield {
+        "type": "done",
         "message": "Processing complete",
         "results_saved_to": results_file if save_results else "Not saved",
         "per_project_scores": projects_dir if projects_dir else "Not saved",
-        "validation_results": clean_nans(results),
-        "hit_rate": clean_nans(hit_rate_result),
+        **({"matrices_saved_to": run_matrices_folder(run_id)} if save_matrices else {}),
     }
 
 
-@router.post("/")
-async def validate_competency_questions(
+def _collect_records(records: Iterator[dict]) -> dict:
+    """Fold pipeline records into the single response body of ``POST /validate/``."""
+    content = {"validation_results": []}
+    for record in records:
+        if record["type"] == "row":
+            content["validation_results"].append(record["result"])
+        elif record["type"] == "hit_rate":
+            content["hit_rate"] = record["hit_rate"]
+        elif record["type"] == "done":
+            content.update({k: v for k, v in record.items() if k != "type"})
+    body = {k: content.get(k) for k in
+            ("message", "results_saved_to", "per_project_scores", "validation_results", "hit_rate")}
+    if "matrices_saved_to" in content:
+        body["matrices_saved_to"] = content["matrices_saved_to"]
+    return body
+
+
+def _run_validation_pipeline(**kwargs) -> dict:
+    """Run the whole pipeline and return a single response body."""
+    return _collect_records(_iter_validation_pipeline(**kwargs))
+
+
+def _stream_records(records: Iterator[dict], fmt: str) -> Iterator[str]:
+    """Serialize pipeline records as NDJSON lines or server-sent events."""
+    try:
+        for record in records:
+            data = json.dumps(record, ensure_ascii=False, default=str)
+            yield f"event: {record['type']}\ndata: {data}\n\n" if fmt == "sse" else data + "\n"
+    except Exception as e:
+        logger.exception("Streaming validation failed")
+        data = json.dumps({"type": "error", "detail": str(e)})
+        yield f"event: error\ndata: {data}\n\n" if fmt == "sse" else data + "\n"
+
+
+@router.get("/cache-stats")
+async def cache_stats():
+    """Size, hit-rate and eviction counters of the embedding and pair-score caches."""
+    pair_cache = get_pair_score_cache()
+    return {
+        "sentence_embeddings": get_embedding_cache().stats(),
+        "bertscore_token_embeddings": token_cache_stats(),
+        "pair_scores": pair_cache.stats() if pair_cache is not None else None,
+    }
+
+
+@router.get("/heatmaps/{file_name}")
+async def get_heatmap(file_name: str):
+    """Serve a heatmap PNG from HEATMAP_OUTPUT_FOLDER, rendering it first if it was saved in on_demand mode."""
+    folder = os.path.realpath(HEATMAP_OUTPUT_FOLDER)
+    path = os.path.realpath(os.path.join(folder, file_name))
+    if ("/" in file_name or "\\" in file_name or not file_name.endswith(".png")
+            or os.path.dirname(path) != folder):
+        raise HTTPException(status_code=400, detail="Invalid heatmap file name.")
+    path = await run_in_threadpool(ensure_heatmap, path)
+    if not path:
+        raise HTTPException(status_code=404, detail="Heatmap not found (it may still be rendering).")
+    return FileResponse(path, media_type="image/png")
+
+
+def _resume_run_id(resume_from: str) -> str:
+    """Run id of a previous run, given as the id itself or as its results file path."""
+    match = re.fullmatch(rf"(?:validation_results_)?({_RUN_ID_PATTERN})(?:\.csv)?",
+                         os.path.basename(resume_from.strip()))
+    if not match:
+        raise HTTPException(status_code=400, detail="resume_from must be a run id or a validation_results_<id>.csv file.")
+    run_id = match.group(1)
+    if not os.path.exists(os.path.join(RESULTS_DIR, f"validation_results_{run_id}.csv")):
+        raise HTTPException(status_code=404, detail=f"No results file for run {run_id} in {RESULTS_DIR}.")
+    return run_id
+
+
+async def _validation_request(
     file: UploadFile = File(None),
     validation_mode: str = Form("all"),
     output_folder: str = Form("heatmaps"),
@@ -186,8 +367,34 @@ async def validate_competency_questions(
     generator_llm_provider: str = Form("openai"),
     generator_model: str = Form(None),
     generated_csv_path: str = Form(None),
-):
-    """Validate competency questions against a gold standard benchmark."""
+    metrics: str = Form(None),
+    workers: int = Form(None),
+    heatmap_mode: str = Form(None),
+    resume_from: str = Form(None),
+    save_matrices: bool = Form(True),
+) -> dict:
+    """Form fields shared by the validation endpoints, resolved to pipeline arguments.
+
+    ``metrics`` optionally overrides the metrics implied by ``validation_mode``
+    with a comma-separated list (e.g. ``cosine,bleu``); only those are computed.
+    ``workers`` validates rows on that many processes (default: VALIDATION_WORKERS).
+    ``heatmap_mode`` is ``background``, ``sync`` or ``on_demand`` (default: HEATMAP_MODE);
+    heatmaps in the result are file paths, served by ``GET /validate/heatmaps/{name}``.
+    ``resume_from`` continues an interrupted run, given its id (the one in
+    its file names) or its ``results_saved_to`` path: only rows missing from its
+    results file are validated, while aggregation and hit rate cover every row.
+    ``save_matrices`` keeps every row's similarity matrices in the run's matrix
+    store, served by ``GET /validate/runs/{run_id}/matrices``.
+    """
+    metric_list = [m.strip().lower() for m in metrics.split(",") if m.strip()] if metrics else None
+    try:
+        plan_validation(validation_mode, metric_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if heatmap_mode and heatmap_mode not in HEATMAP_MODES:
+        raise HTTPException(status_code=400, detail=f"heatmap_mode must be one of {list(HEATMAP_MODES)}.")
+    resume_run_id = _resume_run_id(resume_from) if resume_from else None
+
     if file is not None:
         try:
             contents = await file.read()
@@ -208,6 +415,7 @@ async def validate_competency_questions(
     if "gold standard" not in df.columns and "competency question" not in df.columns:
         raise HTTPException(status_code=400, detail="CSV must contain 'gold standard' or 'Competency Question' column.")
 
+    generation = None
     if "generated" not in df.columns:
         # Resume from a previously saved generation file if provided
         if generated_csv_path and os.path.exists(generated_csv_path):
@@ -218,18 +426,13 @@ async def validate_competency_questions(
             except Exception as e:
                 raise HTTPException(status_code=400, detail=f"Error loading generated_csv_path: {e}")
         else:
-            try:
-                df = call_external_cq_generation_service(
-                    df, external_service_url,
-                    llm_provider=generator_llm_provider,
-                    model=generator_model,
-                )
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error calling external CQ generation service: {e}")
+            # Run by the pipeline itself, so submitting a job or opening a stream does not wait for it
+            generation = dict(external_service_url=external_service_url, llm_provider=generator_llm_provider,
+                              model=generator_model)
 
     gold_col = "gold standard" if "gold standard" in df.columns else "competency question"
 
-    content = _run_validation_pipeline(
+    return dict(
         df=df,
         gold_col=gold_col,
         output_folder=output_folder,
@@ -239,5 +442,147 @@ async def validate_competency_questions(
         save_every=save_every,
         evaluator_llm=evaluator_llm,
         tool_llm=tool_llm,
+        metrics=metric_list,
+        workers=workers,
+        heatmap_mode=heatmap_mode,
+        resume_run_id=resume_run_id,
+        save_matrices=save_matrices,
+        generation=generation,
     )
+
+
+@router.post("/")
+async def validate_competency_questions(pipeline_args: dict = Depends(_validation_request)):
+    """Validate competency questions against a gold standard benchmark (see the form fields)."""
+    try:
+        content = await run_in_threadpool(_run_validation_pipeline, **pipeline_args)
+    except CQGenerationError as e:
+        raise HTTPException(status_code=500, detail=str(e))
     return JSONResponse(content=content)
+
+
+@router.post("/stream")
+async def validate_competency_questions_stream(
+    pipeline_args: dict = Depends(_validation_request),
+    stream_format: str = Form("ndjson"),
+):
+    """Same as ``POST /validate/`` but streamed: one record per validated row as soon as it is
+    computed, then the aggregate, hit-rate and ``done`` records.
+
+    ``stream_format`` is ``ndjson`` (one JSON object per line) or ``sse`` (server-sent events).
+    """
+    if stream_format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="stream_format must be 'ndjson' or 'sse'.")
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_stream_records(_iter_validation_pipeline(**pipeline_args), stream_format),
+                             media_type=media_type)
+
+
+@router.post("/jobs", status_code=202)
+async def submit_validation_job(pipeline_args: dict = Depends(_validation_request)):
+    """Queue a validation run (same form fields as ``POST /validate/``) and return its job id at once."""
+    description = {"validation_mode": pipeline_args["validation_mode"], "metrics": pipeline_args["metrics"]}
+    job = get_job_manager().submit(lambda: _iter_validation_pipeline(**pipeline_args), _collect_records,
+                                   description=description)
+    job.total_rows = len(pipeline_args["df"])
+    return {"job_id": job.id, "status": job.status}
+
+
+@router.get("/jobs")
+async def list_validation_jobs():
+    return [job.status_dict() for job in get_job_manager().list()]
+
+
+def _get_job(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}.")
+    return job
+
+
+@router.get("/jobs/{job_id}")
+async def get_validation_job(job_id: str):
+    """Status, rows done, throughput and ETA of a job."""
+    return _get_job(job_id).status_dict()
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_validation_job_result(job_id: str, format: str = "json"):
+    """Result of a completed job: the ``POST /validate/`` body, or the saved results CSV with ``format=csv``."""
+    job = _get_job(job_id)
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}.")
+    if format == "csv":
+        path = job.result.get("results_saved_to")
+        if not path or not os.path.exists(path):
+            raise HTTPException(status_code=404, detail="This job did not save a results file.")
+        return FileResponse(path, media_type="text/csv", filename=os.path.basename(path))
+    return JSONResponse(content=job.result)
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_validation_job(job_id: str):
+    """Cancel a queued job, or stop a running one after the row in progress."""
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}.")
+    return job.status_dict()
+
+
+def _run_matrices(run_id: str):
+    if not _valid_run_id(run_id):
+        raise HTTPException(status_code=400, detail="Invalid run id.")
+    try:
+        return load_run_matrices(run_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/runs/{run_id}/matrices")
+async def get_run_matrices_index(run_id: str, project: str = None):
+    """Rows, projects and matrix outputs kept for a run (rows optionally limited to one project)."""
+    store = _run_matrices(run_id)
+    return {"run_id": run_id, "rows": store.rows(project), "projects": store.projects(), "outputs": store.outputs()}
+
+
+@router.get("/runs/{run_id}/matrices/{row}/{output}")
+async def get_run_matrix(run_id: str, row: int, output: str, format: str = "json"):
+    """One generated x gold matrix of a run (``output`` e.g. ``cosine``), as JSON with its CQs or as ``.npy``."""
+    store = _run_matrices(run_id)
+    try:
+        entry, matrix = store.entry(row), store.matrix(row, output)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No {output} matrix for row {row} of run {run_id}.")
+    if format == "npy":
+        buffer = BytesIO()
+        np.save(buffer, np.asarray(matrix))
+        return Response(buffer.getvalue(), media_type="application/octet-stream",
+                        headers={"Content-Disposition": f'attachment; filename="{run_id}_{row}_{output}.npy"'})
+    return {"row": row, "output": output, "project": entry["project"], "generated": entry["generated"],
+            "gold": entry["gold"], "matrix": clean_nans(np.asarray(matrix, dtype=float).tolist())}
+
+
+@router.get("/runs/{run_id}/threshold-sweep")
+async def get_threshold_sweep(run_id: str, start: float = 0.0, stop: float = 1.0, num: int = 101,
+                              thresholds: str = None, by_project: bool = False):
+    """precision@t, matches@t and coverage_rate of a finished run for every threshold of a grid.
+
+    The grid is ``num`` points from ``start`` to ``stop``, or the comma-separated
+    ``thresholds``. ``coverage_rate`` is null for runs saved without matrices.
+    """
+    if not _valid_run_id(run_id):
+        raise HTTPException(status_code=400, detail="Invalid run id.")
+    try:
+        grid = [float(t) for t in thresholds.split(",")] if thresholds else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="thresholds must be comma-separated numbers.")
+    if not 0 < (len(grid) if grid is not None else num) <= 10000:
+        raise HTTPException(status_code=400, detail="Between 1 and 10000 thresholds per sweep.")
+    if grid is None:
+        grid = threshold_grid(start, stop, num)
+    try:
+        return await run_in_threadpool(sweep_run, run_id, grid, by_project, RESULTS_DIR)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,198 @@
+"""Optional approximate nearest-neighbour index over benchmark (gold) CQ embeddings.
+
+An inverted-file (IVF) index: the unit-normalised gold vectors are clustered
+with spherical k-means, and a query is scored only against the vectors of the
+``n_probe`` clusters whose centroids are closest to it. Those candidates are
+scored exactly (the re-rank step), so every returned score is a true cosine;
+what can be missed is a best match in a cluster that was not probed. The best
+score of each gold CQ is taken over the pairs the queries probed: exact for
+well-matched gold CQs, a lower bound (-inf if never probed) for the others.
+
+Indexes are keyed by the SBERT model and the ordered gold CQs (a benchmark
+version), built once and saved under ANN_INDEX_DIR. Each query batch re-runs a
+sample of its queries through the exact search; if the index finds fewer than
+ANN_MIN_RECALL of their best matches, the whole batch is answered exactly.
+"""
+import os
+import hashlib
+import threading
+import logging
+
+import numpy as np
+
+from app.services.best_match import BestMatches, best_matches, normalize_rows, SIMILARITY_BLOCK_BYTES
+
+from app.config import (ANN_INDEX_ENABLED, ANN_INDEX_DIR, ANN_MIN_GOLD, ANN_N_PROBE,
+                        ANN_MIN_RECALL, ANN_RECALL_SAMPLE, SBERT_MODEL)
+
+logger = logging.getLogger(__name__)
+
+_KMEANS_ITERATIONS = 10
+
+
+def benchmark_key(gold_cqs: list, model_name: str = SBERT_MODEL) -> str:
+    """Version of a benchmark for indexing: the model and the gold CQs, in order."""
+    digest = hashlib.sha1(model_name.encode("utf-8"))
+    for cq in gold_cqs:
+        digest.update(b"\x1f" + str(cq).encode("utf-8"))
+    return digest.hexdigest()[:20]
+
+
+def _spherical_kmeans(vectors: np.ndarray, n_lists: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_lists, replace=False)].copy()
+    assignment = np.zeros(len(vectors), dtype=np.int64)
+    for _ in range(_KMEANS_ITERATIONS):
+        assignment = best_matches(vectors, centroids, normalized=True).row_arg
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        filled = np.bincount(assignment, minlength=n_lists) > 0
+        centroids[filled] = normalize_rows(sums[filled])
+    return centroids, best_matches(vectors, centroids, normalized=True).row_arg
+
+
+class IVFIndex:
+    def __init__(self, vectors: np.ndarray, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray,
+                 key: str = None):
+        self.vectors = vectors        # unit-norm gold vectors, in gold order
+        self.centroids = centroids
+        self.order = order            # gold indices grouped by list
+        self.offsets = offsets        # list l holds order[offsets[l]:offsets[l + 1]]
+        self.key = key
+        self.last_recall = None
+
+    @classmethod
+    def build(cls, embeddings, n_lists: int = None, key: str = None) -> "IVFIndex":
+        vectors = normalize_rows(embeddings)
+        n_lists = n_lists or int(np.clip(np.sqrt(len(vectors)), 1, 4096))
+        n_lists = max(1, min(n_lists, len(vectors)))
+        centroids, assignment = _spherical_kmeans(vectors, n_lists)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+        return cls(vectors, centroids, order, offsets, key)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, vectors=self.vectors, centroids=self.centroids, order=self.order,
+                 offsets=self.offsets, key=np.array(self.key or ""))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["vectors"], data["centroids"], data["order"], data["offsets"], str(data["key"]) or None)
+
+    def _probe(self, queries: np.ndarray, n_probe: int, max_bytes: int) -> np.ndarray:
+        """Indices of the ``n_probe`` closest lists of each query, shape (len(queries), n_probe)."""
+        chunk = max(1, max_bytes // (4 * len(self.centroids)))
+        probes = []
+        for start in range(0, len(queries), chunk):
+            sims = queries[start:start + chunk] @ self.centroids.T
+            probes.append(np.argpartition(-sims, n_probe - 1, axis=1)[:, :n_probe]
+                          if n_probe < sims.shape[1] else np.broadcast_to(np.arange(sims.shape[1]), sims.shape))
+        return np.concatenate(probes) if probes else np.empty((0, n_probe), dtype=np.int64)
+
+    def search(self, query_embeddings, n_probe: int = None, max_bytes: int = None) -> BestMatches:
+        """Approximate best matches; rows are the gold vectors, columns the queries (as ``best_matches(gold, queries)``)."""
+        max_bytes = max_bytes or SIMILARITY_BLOCK_BYTES
+        queries = normalize_rows(query_embeddings)
+        n_gold, n_q = len(self.vectors), len(queries)
+        result = BestMatches(np.full(n_gold, -np.inf, dtype=np.float32), np.zeros(n_gold, dtype=np.int64),
+                             np.full(n_q, -np.inf, dtype=np.float32), np.zeros(n_q, dtype=np.int64))
+        if not n_gold or not n_q:
+            return result
+        n_probe = max(1, min(n_probe or ANN_N_PROBE, len(self.centroids)))
+        probes = self._probe(queries, n_probe, max_bytes)
+        pair_lists = probes.ravel()
+        pair_queries = np.repeat(np.arange(n_q), n_probe)
+        by_list = np.argsort(pair_lists, kind="stable")
+        bounds = np.searchsorted(pair_lists[by_list], np.arange(len(self.centroids) + 1))
+        for l in range(len(self.centroids)):
+            members = self.order[self.offsets[l]:self.offsets[l + 1]]
+            q_idx = pair_queries[by_list[bounds[l]:bounds[l + 1]]]
+            if not len(members) or not len(q_idx):
+                continue
+            candidates = self.vectors[members]
+            chunk = max(1, max_bytes // (4 * len(members)))
+            for start in range(0, len(q_idx), chunk):
+                q = q_idx[start:start + chunk]
+                # Exact scores of the candidates
+                sims = queries[q] @ candidates.T
+                arg = sims.argmax(axis=1)
+                best = sims[np.arange(len(q)), arg]
+                better = best > result.col_max[q]
+                result.col_max[q[better]] = best[better]
+                result.col_arg[q[better]] = members[arg[better]]
+                arg = sims.argmax(axis=0)
+                best = sims[arg, np.arange(len(members))]
+                better = best > result.row_max[members]
+                result.row_max[members[better]] = best[better]
+                result.row_arg[members[better]] = q[arg[better]]
+        return result
+
+    def recall(self, query_embeddings, approx: BestMatches = None, threshold: float = None,
+               sample: int = None) -> float:
+        """Share of sampled queries whose exact best gold match the index also finds.
+
+        With ``threshold``, sampled gold CQs whose exact best query score reaches
+        it must be found as well (recall of the coverage decisions).
+        """
+        queries = np.asarray(query_embeddings)
+        if not len(queries) or not len(self.vectors):
+            return 1.0
+        approx = approx or self.search(queries)
+        sample = sample or ANN_RECALL_SAMPLE
+        rng = np.random.default_rng(0)
+        picked = rng.choice(len(queries), size=min(len(queries), sample), replace=False)
+        exact = best_matches(self.vectors, queries[picked], normalized=False).col_max
+        found = list(approx.col_max[picked] >= exact - 1e-5)
+        if threshold is not None:
+            picked = rng.choice(len(self.vectors), size=min(len(self.vectors), sample), replace=False)
+            exact = best_matches(self.vectors[picked], queries, normalized=False).row_max
+            reached = exact >= threshold
+            found += list(approx.row_max[picked][reached] >= exact[reached] - 1e-5)
+        return float(np.mean(found))
+
+    def best_matches(self, query_embeddings, threshold: float = None, min_recall: float = None,
+                     max_bytes: int = None) -> BestMatches:
+        """``search`` checked against the exact path on a sample (see ``recall``); below ``min_recall``
+        the exact blockwise search is used instead."""
+        min_recall = ANN_MIN_RECALL if min_recall is None else min_recall
+        approx = self.search(query_embeddings, max_bytes=max_bytes)
+        self.last_recall = self.recall(query_embeddings, approx, threshold)
+        if self.last_recall < min_recall:
+            logger.warning("ANN index %s recall %.3f < %.3f, using exact search", self.key, self.last_recall,
+                           min_recall)
+            return best_matches(self.vectors, query_embeddings, max_bytes=max_bytes)
+        return approx
+
+
+_indexes: dict = {}
+_indexes_lock = threading.Lock()
+
+
+def get_gold_index(gold_cqs: list, gold_embeddings, model_name: str = SBERT_MODEL):
+    """The index of this benchmark version: from memory, then ANN_INDEX_DIR, else built and saved.
+
+    Returns None when indexing is disabled or the benchmark is below ANN_MIN_GOLD CQs.
+    """
+    if not ANN_INDEX_ENABLED or len(gold_cqs) < ANN_MIN_GOLD:
+        return None
+    key = benchmark_key(gold_cqs, model_name)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            return index
+        path = os.path.join(ANN_INDEX_DIR, f"{key}.npz") if ANN_INDEX_DIR else ""
+        if path and os.path.exists(path):
+            index = IVFIndex.load(path)
+        else:
+            logger.info("Building ANN index over %s gold CQs", len(gold_cqs))
+            index = IVFIndex.build(gold_embeddings, key=key)
+            if path:
+                index.save(path)
+        # One benchmark version is normally in use at a time
+        _indexes.clear()
+        _indexes[key] = index
+        return index
@@ -0,0 +1,163 @@
+import logging
+from collections import defaultdict
+
+import numpy as np
+
+from app.services.model_registry import get_bert_scorer
+from app.utils.lru_cache import ByteLRUCache
+
+logger = logging.getLogger(__name__)
+
+try:
+    from bert_score.utils import get_bert_embedding
+    _BERTSCORE_AVAILABLE = True
+except Exception:
+    _BERTSCORE_AVAILABLE = False
+
+from app.config import BERTSCORE_MODEL, BERTSCORE_BATCH_SIZE, BERTSCORE_CACHE_BYTES
+
+
+class TokenEmbeddingCache:
+    """Contextual token embeddings of single sentences, encoded once and LRU-cached.
+
+    Each entry is ``(emb, weight)``: the L2-normalized token embeddings of the
+    sentence (special tokens included, as BERTScore matches against them) and
+    the greedy-matching weights, which are zero for [CLS]/[SEP] and sum to one
+    over the remaining tokens.
+    """
+
+    def __init__(self, max_bytes: int = BERTSCORE_CACHE_BYTES):
+        self._cache = ByteLRUCache(max_bytes)
+        self._idf_dict = None
+
+    def _encode(self, sentences: list, batch_size: int) -> dict:
+        scorer = get_bert_scorer(BERTSCORE_MODEL)
+        if self._idf_dict is None:
+            idf_dict = defaultdict(lambda: 1.0)
+            idf_dict[scorer._tokenizer.sep_token_id] = 0
+            idf_dict[scorer._tokenizer.cls_token_id] = 0
+            self._idf_dict = idf_dict
+
+        # Longest first, as bert_score does, so each batch pads to similar lengths
+        ordered = sorted(sentences, key=lambda s: len(s.split(" ")), reverse=True)
+        encoded = {}
+        for start in range(0, len(ordered), batch_size):
+            batch = ordered[start:start + batch_size]
+            embs, masks, padded_idf = get_bert_embedding(
+                batch, scorer._model, scorer._tokenizer, self._idf_dict, device=scorer.device
+            )
+            embs, masks, padded_idf = embs.cpu(), masks.cpu(), padded_idf.cpu()
+            for i, sent in enumerate(batch):
+                length = int(masks[i].sum().item())
+                emb = embs[i, :length].float().numpy()
+                emb = emb / np.linalg.norm(emb, axis=-1, keepdims=True)
+                weight = padded_idf[i, :length].float().numpy()
+                total = weight.sum()
+                weight = weight / total if total > 0 else np.zeros_like(weight)
+                encoded[sent] = (emb.astype(np.float32), weight.astype(np.float32))
+        return encoded
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+    def embed(self, sentences: list, batch_size: int = None) -> list:
+        """Return ``(emb, weight)`` for each sentence, encoding only cache misses."""
+        found = {}
+        for s in dict.fromkeys(sentences):
+            hit = self._cache.get((BERTSCORE_MODEL, s))
+            if hit is not None:
+                found[s] = hit
+        missing = [s for s in dict.fromkeys(sentences) if s not in found]
+        if missing:
+            encoded = self._encode(missing, batch_size or BERTSCORE_BATCH_SIZE)
+            for s, value in encoded.items():
+                self._cache.put((BERTSCORE_MODEL, s), value)
+            found.update(encoded)
+        return [found[s] for s in sentences]
+
+
+_token_cache = TokenEmbeddingCache()
+
+
+def token_cache_stats() -> dict:
+    return _token_cache.stats()
+
+
+def greedy_match_matrices(hyps: list, refs: list, batch_size: int = None):
+    """BERTScore greedy matching for every (hyp, ref) pair of cached token embeddings.
+
+    ``hyps`` and ``refs`` are lists of ``(emb, weight)`` as produced by
+    ``TokenEmbeddingCache.embed``. All token similarities for a block of
+    ``batch_size`` hypotheses are computed with one matrix product and reduced
+    per sentence, so no per-pair Python work is done.
+    """
+    shape = (len(hyps), len(refs))
+    P = np.zeros(shape)
+    R = np.zeros(shape)
+    if not hyps or not refs:
+        return P, R, np.zeros(shape)
+
+    ref_emb = np.concatenate([e for e, _ in refs])
+    ref_w = np.concatenate([w for _, w in refs])
+    ref_off = np.cumsum([0] + [len(w) for _, w in refs[:-1]])
+    ref_empty = np.array([w.sum() == 0 for _, w in refs])
+
+    step = batch_size or BERTSCORE_BATCH_SIZE
+    for start in range(0, len(hyps), step):
+        block = hyps[start:start + step]
+        hyp_emb = np.concatenate([e for e, _ in block])
+        hyp_w = np.concatenate([w for _, w in block])
+        hyp_off = np.cumsum([0] + [len(w) for _, w in block[:-1]])
+
+        sim = hyp_emb @ ref_emb.T  # (hyp tokens, ref tokens)
+        best_per_hyp_token = np.maximum.reduceat(sim, ref_off, axis=1)
+        best_per_ref_token = np.maximum.reduceat(sim, hyp_off, axis=0)
+        P[start:start + len(block)] = np.add.reduceat(hyp_w[:, None] * best_per_hyp_token, hyp_off, axis=0)
+        R[start:start + len(block)] = np.add.reduceat(best_per_ref_token * ref_w[None, :], ref_off, axis=1)
+
+        hyp_empty = np.array([w.sum() == 0 for _, w in block])
+        P[start:start + len(block)][hyp_empty] = 0.0
+        R[start:start + len(block)][hyp_empty] = 0.0
+
+    P[:, ref_empty] = 0.0
+    R[:, ref_empty] = 0.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        F1 = np.nan_to_num(2 * P * R / (P + R))
+    return P, R, F1
+
+
+def bertscore_matrices(cands: list, refs: list, batch_size: int = None, raise_errors: bool = False):
+    """Score every (candidate, reference) pair with BERTScore.
+
+    Each unique sentence is encoded at most once per process thanks to the
+    token-embedding cache; the pair scores are then derived from the cached
+    tensors. Returns the (P, R, F1) matrices, each of shape
+    (len(cands), len(refs)); all zeros if BERTScore is unavailable or fails,
+    unless ``raise_errors`` is set.
+    """
+    shape = (len(cands), len(refs))
+    if not cands or not refs:
+        return np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    if not _BERTSCORE_AVAILABLE:
+        if raise_errors:
+            raise RuntimeError("bert_score is not installed")
+        return np.zeros(shape), np.zeros(shape), np.zeros(shape)
+
+    try:
+        embedded = _token_cache.embed(list(cands) + list(refs), batch_size=batch_size)
+        return greedy_match_matrices(embedded[:len(cands)], embedded[len(cands):], batch_size=batch_size)
+    except Exception as e:
+        if raise_errors:
+            raise
+        logger.warning("BERTScore computation failed: %s", e)
+        return np.zeros(shape), np.zeros(shape), np.zeros(shape)
+
+
+def bertscore_version() -> str:
+    """Identifies what BERTScore values depend on besides the texts, for result caches."""
+    try:
+        import bert_score
+        lib = getattr(bert_score, "__version__", "unknown")
+    except Exception:
+        lib = "unavailable"
+    return f"{BERTSCORE_MODEL}|bert_score-{lib}|no-idf"
@@ -0,0 +1,64 @@
+"""Best matches between two embedding sets without the dense similarity matrix.
+
+Cosine similarities are computed one tile at a time and folded into running
+row and column maxima (and their argmaxes), so memory stays within
+``max_bytes`` however large the two sets are.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from app.config import SIMILARITY_BLOCK_BYTES
+
+# row_max[i] / row_arg[i]: best column for row i; col_max[j] / col_arg[j]: best row for column j
+BestMatches = namedtuple("BestMatches", ["row_max", "row_arg", "col_max", "col_arg"])
+
+
+def normalize_rows(embeddings) -> np.ndarray:
+    """float32 copy of ``embeddings`` with unit-norm rows (zero rows stay zero)."""
+    emb = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(emb, axis=1, keepdims=True)
+    return emb / np.maximum(norms, 1e-12)
+
+
+def _tile_shape(n_rows: int, n_cols: int, max_bytes: int) -> tuple:
+    cells = max(1, max_bytes // np.dtype(np.float32).itemsize)
+    col_block = min(n_cols, max(1, cells // max(1, n_rows)))
+    row_block = min(n_rows, max(1, cells // col_block))
+    return row_block, col_block
+
+
+def best_matches(emb_a, emb_b, max_bytes: int = None, normalized: bool = False) -> BestMatches:
+    """Row and column best cosine matches of ``emb_a`` (rows) against ``emb_b`` (columns).
+
+    Pass ``normalized=True`` when both already have unit-norm rows.
+    """
+    a = np.asarray(emb_a, dtype=np.float32) if normalized else normalize_rows(emb_a)
+    b = np.asarray(emb_b, dtype=np.float32) if normalized else normalize_rows(emb_b)
+    n_a, n_b = len(a), len(b)
+    row_max = np.full(n_a, -np.inf, dtype=np.float32)
+    row_arg = np.zeros(n_a, dtype=np.int64)
+    col_max = np.full(n_b, -np.inf, dtype=np.float32)
+    col_arg = np.zeros(n_b, dtype=np.int64)
+    if not n_a or not n_b:
+        return BestMatches(row_max, row_arg, col_max, col_arg)
+
+    row_block, col_block = _tile_shape(n_a, n_b, max_bytes or SIMILARITY_BLOCK_BYTES)
+    for c0 in range(0, n_b, col_block):
+        b_tile = b[c0:c0 + col_block]
+        for r0 in range(0, n_a, row_block):
+            sims = a[r0:r0 + row_block] @ b_tile.T
+            rows = slice(r0, r0 + len(sims))
+            tile_arg = sims.argmax(axis=1)
+            tile_max = sims[np.arange(len(sims)), tile_arg]
+            better = tile_max > row_max[rows]
+            row_max[rows] = np.where(better, tile_max, row_max[rows])
+            row_arg[rows] = np.where(better, tile_arg + c0, row_arg[rows])
+
+            cols = slice(c0, c0 + sims.shape[1])
+            tile_arg = sims.argmax(axis=0)
+            tile_max = sims[tile_arg, np.arange(sims.shape[1])]
+            better = tile_max > col_max[cols]
+            col_max[cols] = np.where(better, tile_max, col_max[cols])
+            col_arg[cols] = np.where(better, tile_arg + r0, col_arg[cols])
+    return BestMatches(row_max, row_arg, col_max, col_arg)
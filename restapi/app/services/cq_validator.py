@@ -1,76 +1,69 @@
 import re
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
 import os
 import requests
 from urllib.parse import urlparse
 import math
 from typing import Optional
 
-from app.utils.llm_clients import get_llm_client
-
-try:
-    from app.services.heatmap_generator import generate_heatmap, save_heatmap_image
-except Exception:
-    def generate_heatmap(*args, **kwargs):
-        return None
-    def save_heatmap_image(*args, **kwargs):
-        return None
+from app.utils.llm_clients import get_llm_client, llm_semaphore
 
 try:
     from app.config import OPENAI_API_KEY
 except Exception:
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-try:
-    from bert_score import score as bert_score_fn
-    _BERTSCORE_AVAILABLE = True
-except Exception:
-    _BERTSCORE_AVAILABLE = False
-
-try:
-    from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
-    _BLEU_AVAILABLE = True
-    _smooth = SmoothingFunction().method1
-except Exception:
-    _BLEU_AVAILABLE = False
-    def sentence_bleu(*args, **kwargs):
-        return 0.0
-    _smooth = None
-
-try:
-    from rouge_score import rouge_scorer
-    _ROUGE_AVAILABLE = True
-except Exception:
-    _ROUGE_AVAILABLE = False
+from app.services.metric_registry import METRIC_REGISTRY, plan_validation, compute_metric
+from app.services.model_registry import get_sbert_model
+from app.services.embedding_store import encode_sentences, get_embedding_cache
+from app.services.run_results import RunResultStore
+from app.services.heatmap_renderer import schedule_heatmap, HEATMAP_MODE
+from app.services.matrix_store import MATRICES_KEY
 
 
 class CQValidator:
-    def __init__(self, output_folder: str, model: str = "gpt-4", validation_mode: str = "all"):
+    def __init__(self, output_folder: str, model: str = "gpt-4", validation_mode: str = "all",
+                 bertscore_batch_size: int = None, metrics: list = None, encoder=None,
+                 heatmap_mode: str = None, keep_matrices: bool = False):
         self.output_folder = output_folder
         self.model = model
         self.validation_mode = validation_mode
-        self.sbert_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self._rouge = rouge_scorer.RougeScorer(['rougeLsum'], use_stemmer=True) if _ROUGE_AVAILABLE else None
-        self._embedding_cache: dict = {}
-        self._embedding_dim = self.sbert_model.get_sentence_embedding_dimension()
+        self.metrics = metrics
+        self.heatmap_mode = heatmap_mode or HEATMAP_MODE
+        # Return each row's generated x gold matrices under MATRICES_KEY, e.g. for a MatrixStoreWriter
+        self.keep_matrices = keep_matrices
+        self.plan = plan_validation(validation_mode, metrics)
+        self.bertscore_batch_size = bertscore_batch_size
+        # ``encoder`` (list of str -> embedding matrix) replaces the local SBERT model, e.g. in pool workers
+        self._encoder = encoder
+        self._sbert_model = None
+        self._embedding_cache = get_embedding_cache()
+        # Pair scores of this validator's run, reused by aggregate_dataframe_metrics()
+        self.run_store = RunResultStore()
         self._download_warnings = []
 
+    @property
+    def sbert_model(self):
+        """The local SBERT model, loaded on first use (never with an ``encoder``)."""
+        if self._sbert_model is None and self._encoder is None:
+            self._sbert_model = get_sbert_model()
+        return self._sbert_model
+
     @staticmethod
     def remove_html_tags(text: str) -> str:
         return re.sub(r'<[^>]+>', '', text)
 
+    @staticmethod
+    def split_cqs(text: str) -> list:
+        return [q.strip() + "?" for q in str(text).split("?") if q.strip()]
+
     def _encode_with_cache(self, sentences: list) -> np.ndarray:
+        if self._encoder is not None:
+            return self._encoder(sentences)
         if not sentences:
-            return np.empty((0, self._embedding_dim))
-        missing = [s for s in sentences if s not in self._embedding_cache]
-        if missing:
-            new_embs = self.sbert_model.encode(missing, convert_to_numpy=True)
-            for sent, emb in zip(missing, new_embs):
-                self._embedding_cache[sent] = emb
-        return np.stack([self._embedding_cache[s] for s in sentences])
+            return np.empty((0, self.sbert_model.get_sentence_embedding_dimension()))
+        return encode_sentences(sentences, model=self.sbert_model)
 
     @staticmethod
     def _best_match_vector(cosine_sim_matrix: np.ndarray) -> np.ndarray:
@@ -124,7 +117,8 @@ class CQValidator:
 
     def generate_response(self, chosen_model: str, messages, max_tokens: int = 3000, temperature: float = 0) -> str:
         client = get_llm_client()
-        return client.chat_completion(messages=messages, model=chosen_model, max_tokens=max_tokens, temperature=temperature)
+        with llm_semaphore():
+            return client.chat_completion(messages=messages, model=chosen_model, max_tokens=max_tokens, temperature=temperature)
 
     def aggregate_dataframe_metrics(self, df: pd.DataFrame, gold_col: str = None,
                                     generated_col: str = 'generated', link_cols: list = None,
@@ -148,6 +142,8 @@ class CQValidator:
 
         for gname, group in grouped:
             key = gname if isinstance(gname, tuple) else (gname, '')
+            # Whole cells are the units here; a single-question cell is the same text as the CQ the
+            # row stage scored, so those pairs come from the run store and pair cache
             golds = list(dict.fromkeys(group[gold_col].dropna().astype(str).str.strip().unique().tolist()))
             gens = list(dict.fromkeys(group[generated_col].dropna().astype(str).str.strip().unique().tolist())) if generated_col in group.columns else []
 
@@ -173,10 +169,12 @@ class CQValidator:
                         downloaded.append(path)
 
             metrics = {}
+            ctx = {"generated": gens, "gold": golds, "encode": self._encode_with_cache, "validator": self,
+                   "bertscore_batch_size": self.bertscore_batch_size, "run_store": self.run_store,
+                   "record_scores": False}
             if golds and gens:
                 try:
-                    embeddings = self._encode_with_cache(gens + golds)
-                    cosine_sim_matrix = cosine_similarity(embeddings[:len(gens)], embeddings[len(gens):])
+                    cosine_sim_matrix = compute_metric("cosine", ctx, {})["cosine"]
                     per_gen_best = self._best_match_vector(cosine_sim_matrix)
                     per_gold_best = self._best_match_per_gold(cosine_sim_matrix)
 
@@ -203,39 +201,17 @@ class CQValidator:
 
             if compute_pairwise_metrics and golds and gens and 'error' not in metrics:
                 try:
-                    n_gen, n_gold = len(gens), len(golds)
-                    bert_f1_matrix = np.zeros((n_gen, n_gold))
-                    bleu_matrix = np.zeros((n_gen, n_gold))
-                    rougeL_matrix = np.zeros((n_gen, n_gold))
-
-                    for i, cq_gen in enumerate(gens):
-                        for j, cq_man in enumerate(golds):
-                            if _BERTSCORE_AVAILABLE:
-                                try:
-                                    _, _, F1 = bert_score_fn([cq_gen], [cq_man], lang='en',
-                                                              model_type='microsoft/deberta-xlarge-mnli', verbose=False)
-                                    bert_f1_matrix[i, j] = F1[0].item()
-                                except Exception:
-                                    pass
-                            if _BLEU_AVAILABLE:
-                                try:
-                                    bleu_matrix[i, j] = sentence_bleu([cq_man.split()], cq_gen.split(), smoothing_function=_smooth)
-                                except Exception:
-                                    pass
-                            if self._rouge:
-                                try:
-                                    r = self._rouge.score(cq_man, cq_gen)["rougeLsum"]
-                                    rougeL_matrix[i, j] = float(r.fmeasure)
-                                except Exception:
-                                    pass
-
                     def agg(mat):
                         return {'mean': float(np.mean(mat)), 'median': float(np.median(mat)),
                                 'std': float(np.std(mat)), 'max': float(np.max(mat))}
 
-                    metrics['pairwise_BERTScore_F1'] = agg(bert_f1_matrix)
-                    metrics['pairwise_BLEU'] = agg(bleu_matrix)
-                    metrics['pairwise_ROUGE_L_F1'] = agg(rougeL_matrix)
+                    # Only the batched pairwise metrics the validation plan asked for
+                    outputs = {}
+                    for name in self.plan["order"]:
+                        metric = METRIC_REGISTRY[name]
+                        if metric.batched and metric.pairwise_key:
+                            outputs.update(compute_metric(name, ctx, outputs))
+                            metrics[metric.pairwise_key] = agg(outputs[metric.matrix])
                 except Exception as e:
                     metrics['pairwise_error'] = f"pairwise metrics failed: {e}"
 
@@ -256,8 +232,15 @@ class CQValidator:
         return {'by_group': projects_out, 'overall': overall, 'download_warnings': self._download_warnings}
 
     def validate(self, gold_question: str, generated_question: str) -> dict:
-        input_text = f"Gold standard: {gold_question}\nGenerated: {generated_question}"
+        return self.finish_validation(self.start_validation(gold_question, generated_question))
 
+    def start_validation(self, gold_question: str, generated_question: str) -> dict:
+        """Check the row and compute its local metrics and heatmaps.
+
+        The returned state is passed to finish_validation(), which runs the
+        remote (LLM) metrics and assembles the result; the two halves can run
+        on different threads.
+        """
         try:
             missing_gold = pd.isna(gold_question)
         except Exception:
@@ -275,59 +258,65 @@ class CQValidator:
         gold_question = str(gold_question)
         generated_question = str(generated_question)
 
-        cq_manual = [q.strip() + "?" for q in gold_question.split("?") if q.strip()]
-        cq_generated = [q.strip() + "?" for q in generated_question.split("?") if q.strip()]
+        cq_manual = self.split_cqs(gold_question)
+        cq_generated = self.split_cqs(generated_question)
 
         if not cq_manual or not cq_generated:
             raise ValueError("Both gold standard and generated questions must contain valid questions.")
 
-        # SBERT cosine similarity
-        embeddings = self._encode_with_cache(cq_generated + cq_manual)
-        cosine_sim_matrix = cosine_similarity(
-            embeddings[:len(cq_generated)], embeddings[len(cq_generated):]
-        )
+        ctx = {"generated": cq_generated, "gold": cq_manual, "encode": self._encode_with_cache,
+               "validator": self, "bertscore_batch_size": self.bertscore_batch_size, "run_store": self.run_store}
+        outputs = {}
+        for name in self.plan["local"]:
+            outputs.update(compute_metric(name, ctx, outputs))
+
+        heatmap_paths = {}
+        for name in self.plan["heatmaps"]:
+            metric = METRIC_REGISTRY[name]
+            file_path = schedule_heatmap(outputs[metric.matrix], f"{metric.label} Similarity Heatmap",
+                                         self.output_folder, f"{name}_heatmap", mode=self.heatmap_mode)
+            heatmap_paths[f"{metric.label} Heatmap"] = file_path if file_path else "N/A"
+        return {"ctx": ctx, "outputs": outputs, "heatmaps": heatmap_paths}
+
+    def finish_validation(self, state: dict) -> dict:
+        outputs = state["outputs"]
+        for name in self.plan["remote"]:
+            outputs.update(compute_metric(name, state["ctx"], outputs))
 
-        # Jaccard
-        def jaccard_similarity(str1, str2):
-            set1, set2 = set(str1.split()), set(str2.split())
-            inter = len(set1 & set2)
-            union = len(set1 | set2)
-            return inter / union if union else 0.0
+        result = {}
+        for name in self.plan["order"]:
+            if name in self.plan["report"]:
+                result.update(METRIC_REGISTRY[name].summarize(outputs))
+        result.update(state["heatmaps"])
+        if self.keep_matrices:
+            ctx = state["ctx"]
+            result[MATRICES_KEY] = {
+                "generated": ctx["generated"], "gold": ctx["gold"],
+                "matrices": {out: np.asarray(outputs[out], dtype=np.float32) for name in self.plan["order"]
+                             for out in METRIC_REGISTRY[name].matrices if out in outputs},
+            }
+        return result
 
-        jaccard_sim_matrix = np.zeros((len(cq_generated), len(cq_manual)))
-        for i, cq_gen in enumerate(cq_generated):
-            for j, cq_man in enumerate(cq_manual):
-                jaccard_sim_matrix[i, j] = jaccard_similarity(cq_gen, cq_man)
+    def llm_analysis(self, cq_generated: list, cq_manual: list, outputs: dict) -> str:
+        """Ask the evaluator LLM to compare the two CQ sets, given the similarity matrices."""
+        def nn(x):
+            return None if (x is None or (isinstance(x, float) and math.isnan(x))) else x
 
-        # BERTScore
-        bertscore_matrix = np.zeros((len(cq_generated), len(cq_manual)))
-        precision_matrix = np.zeros((len(cq_generated), len(cq_manual)))
-        recall_matrix = np.zeros((len(cq_generated), len(cq_manual)))
-        bleu_matrix = np.zeros((len(cq_generated), len(cq_manual)))
-        rougeL_f1_matrix = np.zeros((len(cq_generated), len(cq_manual)))
+        def avg(name):
+            return nn(float(np.mean(outputs[name]))) if name in outputs else None
 
-        for i, cq_gen in enumerate(cq_generated):
-            for j, cq_man in enumerate(cq_manual):
-                if _BERTSCORE_AVAILABLE:
-                    try:
-                        P, R, F1 = bert_score_fn([cq_gen], [cq_man], lang='en',
-                                                  model_type='microsoft/deberta-xlarge-mnli', verbose=False)
-                        precision_matrix[i, j] = P[0].item()
-                        recall_matrix[i, j] = R[0].item()
-                        bertscore_matrix[i, j] = F1[0].item()
-                    except Exception:
-                        pass
-                if _BLEU_AVAILABLE:
-                    try:
-                        bleu_matrix[i, j] = sentence_bleu([cq_man.split()], cq_gen.split(), smoothing_function=_smooth)
-                    except Exception:
-                        pass
-                if self._rouge:
-                    try:
-                        r = self._rouge.score(cq_man, cq_gen)["rougeLsum"]
-                        rougeL_f1_matrix[i, j] = float(r.fmeasure)
-                    except Exception:
-                        pass
+        def mx(name):
+            return nn(float(np.max(outputs[name]))) if name in outputs else None
+
+        cosine_sim_matrix = outputs["cosine"]
+        bertscore_matrix = outputs["bertscore_f1"]
+        best_vec = self._best_match_vector(cosine_sim_matrix)
+        min_best = nn(float(best_vec.min())) if best_vec.size else None
+        max_best = nn(float(best_vec.max())) if best_vec.size else None
+        avg_best = nn(float(best_vec.mean())) if best_vec.size else None
+        threshold = 0.6
+        matches_at_thr = self._matches_at_threshold(best_vec, thr=threshold)
+        precision_at_thr = self._precision_at_threshold(best_vec, thr=threshold)
 
         similarity_results = []
         for i, cq_gen in enumerate(cq_generated):
@@ -336,49 +325,20 @@ class CQValidator:
                     "Generated CQ": cq_gen,
                     "Manual CQ": cq_man,
                     "Cosine Similarity": cosine_sim_matrix[i, j],
-                    "Jaccard Similarity": jaccard_sim_matrix[i, j],
                     "BERTScore-F1": bertscore_matrix[i, j],
-                    "BERTScore-Precision": precision_matrix[i, j],
-                    "BERTScore-Recall": recall_matrix[i, j],
-                    "BLEU": bleu_matrix[i, j],
-                    "ROUGE-L-F1": rougeL_f1_matrix[i, j],
                 })
         sim_results_df = pd.DataFrame(similarity_results)
 
-        def nn(x):
-            return None if (x is None or (isinstance(x, float) and math.isnan(x))) else x
-
-        avg_cosine = nn(float(sim_results_df['Cosine Similarity'].mean()))
-        max_cosine = nn(float(sim_results_df['Cosine Similarity'].max()))
-        avg_jaccard = nn(float(sim_results_df['Jaccard Similarity'].mean()))
-        avg_bertscore_f1 = nn(float(sim_results_df['BERTScore-F1'].mean()))
-        max_bertscore_f1 = nn(float(sim_results_df['BERTScore-F1'].max()))
-        avg_bertscore_precision = nn(float(sim_results_df['BERTScore-Precision'].mean()))
-        avg_bertscore_recall = nn(float(sim_results_df['BERTScore-Recall'].mean()))
-        avg_bleu = nn(float(sim_results_df['BLEU'].mean()))
-        max_bleu = nn(float(sim_results_df['BLEU'].max()))
-        avg_rougeL = nn(float(sim_results_df['ROUGE-L-F1'].mean()))
-        max_rougeL = nn(float(sim_results_df['ROUGE-L-F1'].max()))
-
-        best_vec = self._best_match_vector(cosine_sim_matrix)
-        min_best = nn(float(best_vec.min())) if best_vec.size else None
-        max_best = nn(float(best_vec.max())) if best_vec.size else None
-        avg_best = nn(float(best_vec.mean())) if best_vec.size else None
-        threshold = 0.6
-        matches_at_thr = self._matches_at_threshold(best_vec, thr=threshold)
-        precision_at_thr = self._precision_at_threshold(best_vec, thr=threshold)
-
-        # LLM analysis prompt
         sorted_pairs = sim_results_df.sort_values(by='Cosine Similarity', ascending=False).head(5)
         fmt = lambda x: f"{x:.2f}" if x is not None else "N/A"
         prompt = "Analyze the two sets of Competency Questions (CQ) generated and manual.\n\n"
-        prompt += f"Statistics:\n- Average cosine similarity: {fmt(avg_cosine)}\n"
-        prompt += f"- Max cosine similarity: {fmt(max_cosine)}\n"
-        prompt += f"- Average Jaccard: {fmt(avg_jaccard)}\n"
-        prompt += f"- Average BERTScore-F1: {fmt(avg_bertscore_f1)}\n"
-        prompt += f"- Max BERTScore-F1: {fmt(max_bertscore_f1)}\n"
-        prompt += f"- Average BLEU: {fmt(avg_bleu)}\n"
-        prompt += f"- Average ROUGE-L F1: {fmt(avg_rougeL)}\n"
+        prompt += f"Statistics:\n- Average cosine similarity: {fmt(avg('cosine'))}\n"
+        prompt += f"- Max cosine similarity: {fmt(mx('cosine'))}\n"
+        prompt += f"- Average Jaccard: {fmt(avg('jaccard'))}\n"
+        prompt += f"- Average BERTScore-F1: {fmt(avg('bertscore_f1'))}\n"
+        prompt += f"- Max BERTScore-F1: {fmt(mx('bertscore_f1'))}\n"
+        prompt += f"- Average BLEU: {fmt(avg('bleu'))}\n"
+        prompt += f"- Average ROUGE-L F1: {fmt(avg('rouge_l_f1'))}\n"
         prompt += f"- Best-match cosine per generated CQ — min: {fmt(min_best)}, max: {fmt(max_best)}, avg: {fmt(avg_best)}\n"
         prompt += f"- Precision@{threshold}: {precision_at_thr:.2f} ({matches_at_thr} matches)\n\n"
         prompt += "Pairs with highest similarity:\n"
@@ -393,86 +353,12 @@ class CQValidator:
                    "Only suggest genuinely new questions not yet considered by the experts.\n"
                    "Answer clearly and in detail.")
 
-        clean_analysis = None
-        if self.validation_mode in {"llm", "all", "cosine_bertscore_judge"}:
-            messages = [
-                {"role": "system", "content": "You are a semantics expert assistant."},
-                {"role": "user", "content": prompt},
-            ]
-            analysis = self.generate_response(chosen_model=self.model, messages=messages)
-            clean_analysis = self.remove_html_tags(analysis)
-
-        result = {}
-        if self.validation_mode == "cosine_bertscore_judge":
-            judge_scores = self.llm_judge_scores(cq_generated)
-            result["Average Cosine Similarity"] = avg_cosine
-            result["Max Cosine Similarity"] = max_cosine
-            result["Average BERTScore-F1"] = avg_bertscore_f1
-            result["Max BERTScore-F1"] = max_bertscore_f1
-            result["Best-match Cosines"] = best_vec.tolist()
-            result["Matches@0.6"] = matches_at_thr
-            result["Precision@0.6"] = precision_at_thr
-            result["LLM Analysis"] = clean_analysis
-            result["LLM_as_Judge"] = [
-                {"Relevance": int(r["Relevance"]), "Clarity": int(r["Clarity"]),
-                 "Depth": int(r["Depth"]), "Average": float(r["Average"])}
-                for r in judge_scores.to_dict(orient="records")
-            ]
-        elif self.validation_mode == "llm":
-            result["LLM Analysis"] = clean_analysis
-        elif self.validation_mode == "cosine":
-            cosine_heatmap_base64 = generate_heatmap(cosine_sim_matrix, title="Cosine Similarity Heatmap")
-            file_path = ""
-            if self.output_folder:
-                filename = f"cosine_heatmap_{abs(hash(input_text))}.png"
-                file_path = save_heatmap_image(cosine_heatmap_base64, self.output_folder, filename)
-            result["Average Cosine Similarity"] = avg_cosine
-            result["Max Cosine Similarity"] = max_cosine
-            result["Cosine Heatmap"] = file_path if file_path else "N/A"
-            result["Best-match Cosines"] = best_vec.tolist()
-            result["Matches@0.6"] = matches_at_thr
-            result["Precision@0.6"] = precision_at_thr
-        elif self.validation_mode == "jaccard":
-            jaccard_heatmap_base64 = generate_heatmap(jaccard_sim_matrix, title="Jaccard Similarity Heatmap")
-            file_path = ""
-            if self.output_folder:
-                filename = f"jaccard_heatmap_{abs(hash(input_text))}.png"
-                file_path = save_heatmap_image(jaccard_heatmap_base64, self.output_folder, filename)
-            result["Average Jaccard Similarity"] = avg_jaccard
-            result["Jaccard Heatmap"] = file_path if file_path else "N/A"
-        elif self.validation_mode == "bertscore":
-            result["Average BERTScore-F1"] = avg_bertscore_f1
-            result["Max BERTScore-F1"] = max_bertscore_f1
-            result["Average BERTScore-Precision"] = avg_bertscore_precision
-            result["Average BERTScore-Recall"] = avg_bertscore_recall
-        else:  # "all"
-            cosine_heatmap_base64 = generate_heatmap(cosine_sim_matrix, title="Cosine Similarity Heatmap")
-            jaccard_heatmap_base64 = generate_heatmap(jaccard_sim_matrix, title="Jaccard Similarity Heatmap")
-            file_path_cosine = file_path_jaccard = ""
-            if self.output_folder:
-                file_path_cosine = save_heatmap_image(cosine_heatmap_base64, self.output_folder,
-                                                       f"cosine_heatmap_{abs(hash(input_text))}.png")
-                file_path_jaccard = save_heatmap_image(jaccard_heatmap_base64, self.output_folder,
-                                                        f"jaccard_heatmap_{abs(hash(input_text))}.png")
-            result["LLM Analysis"] = clean_analysis
-            result["Average Cosine Similarity"] = avg_cosine
-            result["Max Cosine Similarity"] = max_cosine
-            result["Average Jaccard Similarity"] = avg_jaccard
-            result["Average BERTScore-F1"] = avg_bertscore_f1
-            result["Max BERTScore-F1"] = max_bertscore_f1
-            result["Average BERTScore-Precision"] = avg_bertscore_precision
-            result["Average BERTScore-Recall"] = avg_bertscore_recall
-            result["Average BLEU"] = avg_bleu
-            result["Max BLEU"] = max_bleu
-            result["Average ROUGE-L F1"] = avg_rougeL
-            result["Max ROUGE-L F1"] = max_rougeL
-            result["Cosine Heatmap"] = file_path_cosine if file_path_cosine else "N/A"
-            result["Jaccard Heatmap"] = file_path_jaccard if file_path_jaccard else "N/A"
-            result["Best-match Cosines"] = best_vec.tolist()
-            result["Matches@0.6"] = matches_at_thr
-            result["Precision@0.6"] = precision_at_thr
-
-        return result
+        messages = [
+            {"role": "system", "content": "You are a semantics expert assistant."},
+            {"role": "user", "content": prompt},
+        ]
+        analysis = self.generate_response(chosen_model=self.model, messages=messages)
+        return self.remove_html_tags(analysis)
 
     def llm_judge_scores(self, questions: list) -> pd.DataFrame:
         instructions = (
@@ -0,0 +1,226 @@
+"""Persistent, append-only store of sentence embeddings.
+
+Layout of one store directory (one per model)::
+
+    meta.json     {"model": ..., "dim": ..., "dtype": "float32"}
+    keys.bin      20-byte SHA-1 digests of the normalized sentences, in row order
+    vectors.f32   raw float32 rows, memory-mapped for reads
+
+Rows are only ever appended, so the files survive restarts and can be shared
+by several workers; a crash between the two appends leaves at most a few
+orphan vector bytes, which are trimmed on the next write.
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+import unicodedata
+import logging
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, threads are still serialized
+    fcntl = None
+
+from app.utils.lru_cache import ByteLRUCache
+
+from app.config import EMBEDDING_STORE_DIR, SBERT_MODEL, EMBEDDING_CACHE_BYTES, EMBEDDING_CACHE_FLOAT16
+
+logger = logging.getLogger(__name__)
+
+_DIGEST_SIZE = 20
+
+
+def normalize_sentence(sentence: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", str(sentence)).split())
+
+
+def sentence_key(sentence: str) -> bytes:
+    return hashlib.sha1(normalize_sentence(sentence).encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    def __init__(self, root: str, model_name: str, dim: int):
+        self.model_name = model_name
+        self.dim = int(dim)
+        self.path = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        os.makedirs(self.path, exist_ok=True)
+        self._keys_path = os.path.join(self.path, "keys.bin")
+        self._vectors_path = os.path.join(self.path, "vectors.f32")
+        self._lock_path = os.path.join(self.path, ".lock")
+        self._row_bytes = self.dim * 4
+        self._index: dict = {}
+        self._keys_bytes_read = 0
+        self._vectors = None
+        self._mapped_rows = 0
+        self._lock = threading.Lock()
+        self._check_meta()
+        self._refresh_index()
+
+    def _check_meta(self) -> None:
+        meta_path = os.path.join(self.path, "meta.json")
+        meta = {"model": self.model_name, "dim": self.dim, "dtype": "float32"}
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                stored = json.load(f)
+            if stored.get("dim") != self.dim:
+                raise ValueError(f"Embedding store {self.path} has dim {stored.get('dim')}, expected {self.dim}.")
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+    def _refresh_index(self) -> None:
+        """Pick up keys appended since the last read (possibly by another process)."""
+        if not os.path.exists(self._keys_path):
+            return
+        size = os.path.getsize(self._keys_path)
+        size -= size % _DIGEST_SIZE
+        if size <= self._keys_bytes_read:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._keys_bytes_read)
+            data = f.read(size - self._keys_bytes_read)
+        row = self._keys_bytes_read // _DIGEST_SIZE
+        for off in range(0, len(data), _DIGEST_SIZE):
+            self._index[data[off:off + _DIGEST_SIZE]] = row
+            row += 1
+        self._keys_bytes_read = size
+
+    def _rows(self, rows: list) -> np.ndarray:
+        needed = max(rows) + 1
+        if self._vectors is None or needed > self._mapped_rows:
+            total = self._keys_bytes_read // _DIGEST_SIZE
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(total, self.dim))
+            self._mapped_rows = total
+        return np.asarray(self._vectors[rows])
+
+    def _append(self, keys: list, vectors: np.ndarray) -> None:
+        with open(self._lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh_index()
+                rows = self._keys_bytes_read // _DIGEST_SIZE
+                with open(self._vectors_path, "ab") as vf:
+                    vf.truncate(rows * self._row_bytes)
+                    vf.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+                    vf.flush()
+                    os.fsync(vf.fileno())
+                with open(self._keys_path, "ab") as kf:
+                    kf.write(b"".join(keys))
+                    kf.flush()
+                self._refresh_index()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, sentences: list) -> dict:
+        """Return {position: vector} for the sentences already in the store."""
+        with self._lock:
+            self._refresh_index()
+            hits = {i: self._index[k] for i, k in enumerate(map(sentence_key, sentences)) if k in self._index}
+            if not hits:
+                return {}
+            vectors = self._rows(list(hits.values()))
+        return dict(zip(hits.keys(), vectors))
+
+    def encode(self, sentences: list, encoder) -> np.ndarray:
+        """Embed ``sentences``, calling ``encoder(list_of_str)`` only for unseen ones."""
+        if not sentences:
+            return np.empty((0, self.dim), dtype=np.float32)
+        found = self.get(sentences)
+        missing = list(dict.fromkeys(s for i, s in enumerate(sentences) if i not in found))
+        if missing:
+            new_vectors = np.asarray(encoder(missing), dtype=np.float32)
+            new_keys = [sentence_key(s) for s in missing]
+            with self._lock:
+                self._append(new_keys, new_vectors)
+            fresh = dict(zip(new_keys, new_vectors))
+            for i, s in enumerate(sentences):
+                if i not in found:
+                    found[i] = fresh[sentence_key(s)]
+        return np.stack([found[i] for i in range(len(sentences))])
+
+
+class EmbeddingCache:
+    """In-memory LRU front for sentence embeddings, bounded by a byte budget.
+
+    With ``float16=True`` vectors are kept at half precision (half the memory,
+    ~1e-3 relative error on cosines) and handed back as float32.
+    """
+
+    def __init__(self, max_bytes: int = EMBEDDING_CACHE_BYTES, float16: bool = EMBEDDING_CACHE_FLOAT16):
+        self._cache = ByteLRUCache(max_bytes)
+        self.float16 = float16
+
+    def get(self, model_name: str, sentence: str):
+        vec = self._cache.get((model_name, sentence))
+        return None if vec is None else vec.astype(np.float32)
+
+    def put(self, model_name: str, sentence: str, vector) -> None:
+        vec = np.asarray(vector, dtype=np.float16 if self.float16 else np.float32)
+        self._cache.put((model_name, sentence), vec)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "float16": self.float16}
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+_embedding_cache = EmbeddingCache()
+_stores: dict = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    return _embedding_cache
+
+
+def get_embedding_store(model_name: str, dim: int, root: str = EMBEDDING_STORE_DIR):
+    """Shared store for ``model_name``, or None when persistence is disabled."""
+    if not root:
+        return None
+    key = (os.path.abspath(root), model_name)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = EmbeddingStore(root, model_name, dim)
+        return _stores[key]
+
+
+def encode_sentences(sentences: list, model=None, model_name: str = SBERT_MODEL) -> np.ndarray:
+    """SBERT-encode ``sentences``: memory cache first, then the persistent store, then the model."""
+    if model is None:
+        from app.services.model_registry import get_sbert_model
+        model = get_sbert_model(model_name)
+    dim = model.get_sentence_embedding_dimension()
+    if not sentences:
+        return np.empty((0, dim), dtype=np.float32)
+
+    found = {}
+    for s in dict.fromkeys(sentences):
+        vec = _embedding_cache.get(model_name, s)
+        if vec is not None:
+            found[s] = vec
+    missing = [s for s in dict.fromkeys(sentences) if s not in found]
+    if missing:
+        encoder = lambda batch: model.encode(batch, convert_to_numpy=True)
+        try:
+            store = get_embedding_store(model_name, dim)
+        except Exception as e:
+            logger.warning("Embedding store unavailable, encoding in memory: %s", e)
+            store = None
+        new_vectors = store.encode(missing, encoder) if store is not None else encoder(missing)
+        for s, vec in zip(missing, new_vectors):
+            _embedding_cache.put(model_name, s, vec)
+            found[s] = np.asarray(vec, dtype=np.float32)
+    return np.stack([found[s] for s in sentences])
@@ -1,23 +1,55 @@
 import io
+import os
 import base64
-import matplotlib.pyplot as plt
+import tempfile
+import numpy as np
 import seaborn as sns
+from matplotlib import cm
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
-def generate_heatmap(similarity_matrix, title="Heatmap"):
+from app.config import HEATMAP_ANNOTATE_MAX_CELLS, HEATMAP_MAX_SIDE
+
+def _heatmap_figure(similarity_matrix, title):
     """
-    Generate a heatmap using seaborn and return it as a base64-encoded PNG.
+    Annotated seaborn heatmap on its own Figure. No pyplot state is touched,
+    so concurrent renders in different threads do not interfere.
     """
-    fig, ax = plt.subplots(figsize=(8, 6))
+    fig = Figure(figsize=(8, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
     sns.heatmap(similarity_matrix, annot=True, cmap="coolwarm", fmt=".2f", ax=ax)
     ax.set_title(title)
-    plt.tight_layout()
+    fig.tight_layout()
+    return fig
+
+
+def _write_atomically(file_path, write):
+    """
+    Call ``write(tmp_path)`` on a uniquely named file next to ``file_path``, then
+    rename it into place, so the file is never seen half-written.
+    """
+    directory = os.path.dirname(file_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(file_path) + ".", suffix=".tmp")
+    os.close(fd)
+    os.chmod(tmp_path, 0o644)  # mkstemp makes it owner-only
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return file_path
 
+
+def generate_heatmap(similarity_matrix, title="Heatmap"):
+    """
+    Generate a heatmap using seaborn and return it as a base64-encoded PNG.
+    """
     buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    buf.seek(0)
-    encoded = base64.b64encode(buf.read()).decode('utf-8')
-    plt.close(fig)
-    return encoded
+    _heatmap_figure(similarity_matrix, title).savefig(buf, format='png', bbox_inches='tight')
+    return base64.b64encode(buf.getvalue()).decode('utf-8')
 
 def save_heatmap_image(encoded_image, output_folder, name):
     """
@@ -31,3 +63,83 @@ def save_heatmap_image(encoded_image, output_folder, name):
     with open(file_path, 'wb') as f:
         f.write(image_data)
     return file_path
+
+def render_heatmap_png(similarity_matrix, title, file_path):
+    """
+    Draw the heatmap straight to a PNG file (no base64 round-trip) and return its path.
+    """
+    fig = _heatmap_figure(similarity_matrix, title)
+    return _write_atomically(file_path, lambda path: fig.savefig(path, format='png', bbox_inches='tight'))
+
+
+# Layout of the fast image: title band on top, heatmap, then the colour legend on the right
+_PAD = 4
+_TITLE_HEIGHT = 16
+_LEGEND_WIDTH = 40
+_BAR_WIDTH = 10
+
+
+def _overview(matrix, max_side):
+    """Max-pool blocks of rows/columns so that neither side exceeds max_side (a strong pair is never dropped)."""
+    for axis, n in enumerate(matrix.shape):
+        if n > max_side:
+            starts = np.linspace(0, n, max_side + 1).astype(int)[:-1]
+            matrix = np.maximum.reduceat(matrix, starts, axis=axis)
+    return matrix
+
+
+def render_heatmap_image(similarity_matrix, title, file_path, max_side=None):
+    """
+    Write the matrix straight to a PNG through the colormap, with no per-cell artists.
+    Each cell becomes a block of pixels; matrices with a side above max_side are
+    max-pooled to an overview first, so the cost does not grow with the matrix.
+    Colours use a fixed 0..1 scale (shown by the legend), so images are comparable;
+    the title is drawn above the heatmap and also stored in the PNG metadata.
+    """
+    try:
+        from PIL import Image, ImageDraw, PngImagePlugin
+    except ImportError as e:
+        raise ImportError("Rendering heatmap images needs Pillow (pip install Pillow).") from e
+    max_side = max_side or HEATMAP_MAX_SIDE
+    matrix = np.asarray(similarity_matrix)
+    if matrix.ndim != 2 or matrix.size == 0:
+        matrix = np.zeros((1, 1))
+    matrix = _overview(np.nan_to_num(matrix.astype(float)), max_side)
+    lut = (cm.coolwarm(np.linspace(0, 1, 256))[:, :3] * 255).astype(np.uint8)
+    pixels = lut[(np.clip(matrix, 0.0, 1.0) * 255).astype(np.uint8)]
+    cell = max(1, min(16, max_side // max(matrix.shape)))
+    if cell > 1:
+        pixels = np.repeat(np.repeat(pixels, cell, axis=0), cell, axis=1)
+
+    height, width = pixels.shape[:2]
+    title = str(title)
+    title_width = int(ImageDraw.Draw(Image.new("RGB", (1, 1))).textlength(title))
+    bar_height = max(height, 64)
+    canvas = Image.new("RGB", (max(width + _LEGEND_WIDTH, title_width + _PAD) + 2 * _PAD,
+                               bar_height + _TITLE_HEIGHT + 2 * _PAD), "white")
+    top = _TITLE_HEIGHT + _PAD
+    canvas.paste(Image.fromarray(pixels), (_PAD, top))
+    draw = ImageDraw.Draw(canvas)
+    draw.text((_PAD, _PAD // 2), title, fill="black")
+    # Legend: the colormap from 1 (top) to 0 (bottom), labelled at both ends and the middle
+    bar_x = _PAD + width + _PAD
+    bar = lut[np.linspace(255, 0, bar_height).astype(np.uint8)][:, None, :].repeat(_BAR_WIDTH, axis=1)
+    canvas.paste(Image.fromarray(bar), (bar_x, top))
+    for value in (1.0, 0.5, 0.0):
+        y = top + round((1.0 - value) * (bar_height - 1))
+        draw.text((bar_x + _BAR_WIDTH + 3, min(max(y - 5, top), top + bar_height - 11)), f"{value:g}", fill="black")
+
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Title", title)
+    # Low zlib effort: encoding dominates the cost and the images are small anyway
+    return _write_atomically(file_path, lambda path: canvas.save(path, format="PNG", pnginfo=info, compress_level=1))
+
+
+def render_heatmap(similarity_matrix, title, file_path, annotate_max_cells=None):
+    """
+    Annotated seaborn heatmap for small matrices, fast image rendering otherwise.
+    """
+    limit = HEATMAP_ANNOTATE_MAX_CELLS if annotate_max_cells is None else annotate_max_cells
+    if 0 < np.size(similarity_matrix) <= limit:
+        return render_heatmap_png(similarity_matrix, title, file_path)
+    return render_heatmap_image(similarity_matrix, title, file_path)
@@ -0,0 +1,179 @@
+"""Heatmap rendering off the validation critical path.
+
+Modes (HEATMAP_MODE, or per validator):
+
+* ``background`` – PNGs are drawn by a small process pool; the result gets the
+  path the file will have once rendered.
+* ``sync`` – drawn inline, straight to the PNG file.
+* ``on_demand`` – only the matrix is saved (``.npz`` next to the PNG path);
+  the PNG is drawn the first time it is requested through ``ensure_heatmap``.
+
+Files are named after a hash of the matrix and title, so an identical heatmap
+is never drawn twice; reusing one refreshes its mtime, and with
+HEATMAP_FOLDER_MAX_BYTES set the least recently used files are evicted.
+"""
+import os
+import time
+import hashlib
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.config import HEATMAP_MODE, HEATMAP_RENDER_WORKERS, HEATMAP_FOLDER_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+HEATMAP_MODES = ("background", "sync", "on_demand")
+
+# Folders are scanned for eviction at most this often
+_EVICT_INTERVAL_S = 30
+
+_pool = None
+_pool_lock = threading.Lock()
+# Background renders not finished yet, by file path
+_inflight: dict = {}
+_last_eviction: dict = {}
+
+
+def _render(matrix, title: str, file_path: str) -> str:
+    try:
+        from app.services.heatmap_generator import render_heatmap
+    except Exception as e:
+        logger.warning("Heatmap rendering unavailable: %s", e)
+        return ""
+    return render_heatmap(matrix, title, file_path)
+
+
+def _get_pool_locked() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max(1, HEATMAP_RENDER_WORKERS),
+                                    mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _log_failure(future, file_path: str) -> None:
+    if future.exception() is not None:
+        logger.warning("Rendering heatmap %s failed: %s", file_path, future.exception())
+
+
+def _matrix_path(file_path: str) -> str:
+    return os.path.splitext(file_path)[0] + ".npz"
+
+
+def heatmap_file_name(prefix: str, matrix, title: str) -> str:
+    """Stable name for a heatmap: the same matrix and title always give the same file."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float64)
+    digest = hashlib.sha1()
+    digest.update(repr(matrix.shape).encode("utf-8"))
+    digest.update(matrix.tobytes())
+    digest.update(str(title).encode("utf-8"))
+    return f"{prefix}_{digest.hexdigest()[:20]}.png"
+
+
+def _touch(path: str) -> bool:
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+
+def evict_heatmaps(output_folder: str, max_bytes: int = None) -> int:
+    """Delete the least recently used heatmaps (.png/.npz) until the folder fits ``max_bytes``; returns the count."""
+    max_bytes = HEATMAP_FOLDER_MAX_BYTES if max_bytes is None else max_bytes
+    if not max_bytes or not os.path.isdir(output_folder):
+        return 0
+    files = []
+    for entry in os.scandir(output_folder):
+        if entry.is_file() and entry.name.endswith((".png", ".npz")):
+            st = entry.stat()
+            files.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if path in _inflight:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _maybe_evict(output_folder: str) -> None:
+    if not HEATMAP_FOLDER_MAX_BYTES:
+        return
+    now = time.monotonic()
+    with _pool_lock:
+        if now - _last_eviction.get(output_folder, float("-inf")) < _EVICT_INTERVAL_S:
+            return
+        _last_eviction[output_folder] = now
+    removed = evict_heatmaps(output_folder)
+    if removed:
+        logger.info("Evicted %s heatmap files from %s", removed, output_folder)
+
+
+def _render_done(future, file_path: str) -> None:
+    with _pool_lock:
+        _inflight.pop(file_path, None)
+    _log_failure(future, file_path)
+
+
+def schedule_heatmap(matrix, title: str, output_folder: str, prefix: str, mode: str = None) -> str:
+    """Arrange for the heatmap of ``matrix`` to exist in ``output_folder`` and return its path ("" if none).
+
+    Nothing is rendered (or saved) if a file for the same matrix and title is
+    already there or being rendered.
+    """
+    if not output_folder:
+        return ""
+    mode = mode or HEATMAP_MODE
+    matrix = np.asarray(matrix)
+    file_path = os.path.join(output_folder, heatmap_file_name(prefix, matrix, title))
+    _maybe_evict(output_folder)
+    if file_path in _inflight or _touch(file_path):
+        return file_path
+    os.makedirs(output_folder, exist_ok=True)
+    if mode == "on_demand":
+        if not _touch(_matrix_path(file_path)):
+            np.savez(_matrix_path(file_path), matrix=matrix, title=np.array(title))
+        return file_path
+    if mode == "background":
+        try:
+            with _pool_lock:
+                future = _get_pool_locked().submit(_render, matrix, title, file_path)
+                _inflight[file_path] = future
+            future.add_done_callback(lambda f: _render_done(f, file_path))
+            return file_path
+        except Exception as e:
+            logger.warning("Heatmap render pool unavailable, rendering inline: %s", e)
+    return _render(matrix, title, file_path)
+
+
+def ensure_heatmap(file_path: str) -> str:
+    """Return ``file_path`` once the PNG exists, rendering it from its saved matrix if needed ("" if neither exists)."""
+    if os.path.exists(file_path):
+        return file_path
+    saved = _matrix_path(file_path)
+    if not os.path.exists(saved):
+        return ""
+    with np.load(saved) as data:
+        return _render(data["matrix"], str(data["title"]), file_path)
+
+
+def shutdown_heatmap_renderer(wait: bool = True) -> None:
+    """Finish (or drop) queued renders and stop the pool."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    # Outside the lock: completion callbacks take it
+    if pool is not None:
+        pool.shutdown(wait=wait)
@@ -4,26 +4,22 @@ import numpy as np
 import requests
 import openai
 
-from sentence_transformers import SentenceTransformer, util as sbert_util
-
-logger = logging.getLogger(__name__)
-
-_sbert_model = None
+from sentence_transformers import util as sbert_util
 
+from app.services.model_registry import get_sbert_model
+from app.services.embedding_store import encode_sentences
+from app.services.best_match import best_matches, normalize_rows
+from app.services.ann_index import get_gold_index
 
-def _get_sbert_model() -> SentenceTransformer:
-    global _sbert_model
-    if _sbert_model is None:
-        _sbert_model = SentenceTransformer("all-MiniLM-L6-v2")
-    return _sbert_model
+logger = logging.getLogger(__name__)
 
 
 def sbert_similarity_matrix(cqs_a: list, cqs_b: list) -> np.ndarray:
     """Compute cosine similarity matrix between two lists of CQs using SBERT.
     Returns shape (len(cqs_a), len(cqs_b))."""
-    model = _get_sbert_model()
-    emb_a = model.encode(cqs_a, convert_to_tensor=True)
-    emb_b = model.encode(cqs_b, convert_to_tensor=True)
+    model = get_sbert_model()
+    emb_a = encode_sentences(cqs_a, model=model)
+    emb_b = encode_sentences(cqs_b, model=model)
     return sbert_util.cos_sim(emb_a, emb_b).cpu().numpy()
 
 
@@ -161,9 +157,13 @@ class HitRateEvaluator:
         not yet captured by the benchmark.
     """
 
-    def __init__(self, threshold: float = 0.6, k: int = 3):
+    def __init__(self, threshold: float = 0.6, k: int = 3, max_block_bytes: int = None):
         self.threshold = threshold
         self.k = k
+        # Memory budget of each similarity tile (default SIMILARITY_BLOCK_BYTES)
+        self.max_block_bytes = max_block_bytes
+        # Best tool-CQ similarity of each benchmark CQ, set by compute() (e.g. for threshold sweeps)
+        self.best_per_bench = None
 
     def compute(
         self,
@@ -172,7 +172,15 @@ class HitRateEvaluator:
         scenario_context: str,
         evaluator_llm: str,
         tool_llm: str = None,
+        bench_embeddings=None,
+        tool_embeddings=None,
     ) -> dict:
+        """Coverage of ``bench_cqs`` by ``tool_cqs`` (see the class docstring).
+
+        Each CQ set is embedded once and every similarity is taken from those
+        unit-normalised embeddings; ``bench_embeddings`` / ``tool_embeddings``
+        (one row per CQ, e.g. from the validation stage) skip the encoding.
+        """
         if not bench_cqs:
             raise ValueError("bench_cqs cannot be empty.")
         if not tool_cqs:
@@ -184,8 +192,24 @@ class HitRateEvaluator:
             )
 
         # --- Phase 1: base coverage ---
-        sim_matrix = sbert_similarity_matrix(bench_cqs, tool_cqs)  # (|Bench|, |Tool|)
-        best_per_bench = sim_matrix.max(axis=1)  # (|Bench|,)
+        def embed(cqs: list, precomputed=None) -> np.ndarray:
+            if precomputed is not None:
+                if len(precomputed) != len(cqs):
+                    raise ValueError(f"Got {len(precomputed)} embeddings for {len(cqs)} CQs.")
+                return normalize_rows(precomputed)
+            return normalize_rows(encode_sentences(cqs, model=get_sbert_model()))
+
+        bench_emb = embed(bench_cqs, bench_embeddings)
+        tool_emb = embed(tool_cqs, tool_embeddings)
+        # Large benchmarks go through the ANN index when ANN_INDEX_ENABLED
+        gold_index = get_gold_index(bench_cqs, bench_emb)
+        if gold_index is not None:
+            bench_vs_tool = gold_index.best_matches(tool_emb, threshold=self.threshold,
+                                                    max_bytes=self.max_block_bytes)
+        else:
+            bench_vs_tool = best_matches(bench_emb, tool_emb, max_bytes=self.max_block_bytes, normalized=True)
+        best_per_bench = bench_vs_tool.row_max  # (|Bench|,)
+        self.best_per_bench = best_per_bench
         covered_mask = best_per_bench >= self.threshold
 
         covered = int(covered_mask.sum())
@@ -206,22 +230,29 @@ class HitRateEvaluator:
 
             if gap_cqs:
                 # Keep gap CQs that match at least one benchmark CQ
-                gap_vs_bench = sbert_similarity_matrix(bench_cqs, gap_cqs)  # (|Bench|, |gap|)
-                gap_max_vs_bench = gap_vs_bench.max(axis=0)  # (|gap|,)
+                gap_emb = embed(gap_cqs)
+                if gold_index is not None:
+                    gap_max_vs_bench = gold_index.best_matches(gap_emb, max_bytes=self.max_block_bytes).col_max
+                else:
+                    gap_max_vs_bench = best_matches(bench_emb, gap_emb, max_bytes=self.max_block_bytes,
+                                                    normalized=True).col_max  # (|gap|,)
                 valid_mask = gap_max_vs_bench >= self.threshold
                 valid_gap_cqs = [gap_cqs[i] for i in range(len(gap_cqs)) if valid_mask[i]]
 
                 if valid_gap_cqs:
+                    valid_gap_emb = gap_emb[valid_mask]
                     # Count missed bench CQs recovered by valid gap CQs
-                    missed_vs_valid = sbert_similarity_matrix(missed_bench_cqs, valid_gap_cqs)
-                    recovered = int((missed_vs_valid.max(axis=1) >= self.threshold).sum())
+                    missed_vs_valid = best_matches(bench_emb[~covered_mask], valid_gap_emb,
+                                                   max_bytes=self.max_block_bytes, normalized=True)
+                    recovered = int((missed_vs_valid.row_max >= self.threshold).sum())
 
                     # Rescue: tool CQs that had no bench match but match valid gap CQs
-                    uncovered_tool_mask = sim_matrix.max(axis=0) < self.threshold
+                    uncovered_tool_mask = bench_vs_tool.col_max < self.threshold
                     uncovered_tool_cqs = [tool_cqs[i] for i in range(len(tool_cqs)) if uncovered_tool_mask[i]]
                     if uncovered_tool_cqs:
-                        unlisted_vs_gap = sbert_similarity_matrix(uncovered_tool_cqs, valid_gap_cqs)
-                        rescued_mask = unlisted_vs_gap.max(axis=1) >= self.threshold
+                        unlisted_vs_gap = best_matches(tool_emb[uncovered_tool_mask], valid_gap_emb,
+                                                       max_bytes=self.max_block_bytes, normalized=True)
+                        rescued_mask = unlisted_vs_gap.row_max >= self.threshold
                         rescued_tool_cqs = [
                             uncovered_tool_cqs[i]
                             for i in range(len(uncovered_tool_cqs))
@@ -0,0 +1,162 @@
+"""Background jobs for long validation runs.
+
+A job consumes the record stream of the validation pipeline on a bounded
+thread pool; its progress (rows done, throughput, ETA) is updated from the
+``row`` records as they arrive, and cancelling it closes the stream, which
+stops the pipeline after the row in progress.
+"""
+import time
+import uuid
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import VALIDATION_JOB_WORKERS, VALIDATION_JOB_HISTORY
+
+logger = logging.getLogger(__name__)
+
+JOB_STATES = ("queued", "running", "completed", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, description: dict = None):
+        self.id = uuid.uuid4().hex
+        self.description = description or {}
+        self.status = "queued"
+        self.phase = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.rows_done = 0
+        self.total_rows = None
+        self.eta_s = None
+        self.result = None
+        self.error = None
+        self._cancel = threading.Event()
+        self._future = None
+
+    def _track(self, records):
+        """Pass records through, updating progress and stopping when cancelled."""
+        for record in records:
+            if self._cancel.is_set():
+                raise JobCancelled()
+            self.phase = record.get("type")
+            if self.phase == "row":
+                self.rows_done = record.get("row", self.rows_done + 1)
+                self.total_rows = record.get("total", self.total_rows)
+                self.eta_s = record.get("eta_s")
+            yield record
+
+    def status_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "phase": self.phase,
+            "rows_done": self.rows_done,
+            "total_rows": self.total_rows,
+            "rows_per_s": round(self.rows_done / elapsed, 3) if elapsed > 0 and self.rows_done else None,
+            "eta_s": self.eta_s if self.status == "running" else None,
+            "elapsed_s": round(elapsed, 1),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            **self.description,
+        }
+
+
+class JobManager:
+    """Runs jobs on ``max_workers`` threads and remembers the last ``history`` finished ones."""
+
+    def __init__(self, max_workers: int = VALIDATION_JOB_WORKERS, history: int = VALIDATION_JOB_HISTORY):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="validation-job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.history = history
+
+    def submit(self, records_factory, collect, description: dict = None) -> Job:
+        """Queue a job: ``collect(records)`` consumes ``records_factory()`` and returns the result."""
+        job = Job(description)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        job._future = self._pool.submit(self._run, job, records_factory, collect)
+        return job
+
+    def _run(self, job: Job, records_factory, collect) -> None:
+        if job._cancel.is_set():
+            # Cancelled as the worker picked it up, too late for future.cancel()
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        records = records_factory()
+        try:
+            job.result = collect(job._track(records))
+            job.status = "completed"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            logger.exception("Validation job %s failed", job.id)
+            job.status, job.error = "failed", str(e)
+        finally:
+            close = getattr(records, "close", None)
+            if close is not None:
+                close()
+            job.finished_at = time.time()
+
+    def _prune(self) -> None:
+        finished = [j for j in self._jobs.values() if j.finished_at is not None]
+        for job in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str):
+        """Cancel a queued job, or stop a running one after its current row. Returns the job or None."""
+        job = self.get(job_id)
+        if job is None or job.finished_at is not None:
+            return job
+        job._cancel.set()
+        if job._future is not None and job._future.cancel():
+            job.status = "cancelled"
+            job.finished_at = time.time()
+        return job
+
+    def shutdown(self) -> None:
+        for job in self.list():
+            job._cancel.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
+
+
+def shutdown_job_manager() -> None:
+    global _manager
+    with _manager_lock:
+        manager, _manager = _manager, None
+    if manager is not None:
+        manager.shutdown()
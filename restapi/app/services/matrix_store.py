@@ -0,0 +1,170 @@
+"""Per-run store of the generated x gold matrices behind every validated row.
+
+A run folder holds two append-only files:
+
+* ``matrices.f32`` – the raw float32 values of every matrix, back to back;
+* ``index.jsonl`` – one line per row: its position, project, row hash, the
+  generated and gold CQs (matrix rows and columns) and, per output (``cosine``,
+  ``jaccard``, ``bertscore_f1``...), the offset of its matrix in the data file.
+
+The hit-rate phase adds ``bench_best_match.npy``: the best tool-CQ score of
+every benchmark CQ, from which coverage can be recomputed at any threshold.
+
+A row's index line is written after its data, so a crash leaves at most a
+dangling tail that ``MatrixStoreWriter(append=True)`` cuts off. ``MatrixStore``
+memory-maps the data file and returns single matrices without reading the rest.
+"""
+import os
+import json
+import threading
+
+import numpy as np
+
+from app.config import RESULTS_DIR
+
+# Result key under which CQValidator(keep_matrices=True) returns a row's matrices
+MATRICES_KEY = "_matrices"
+
+DATA_FILE = "matrices.f32"
+INDEX_FILE = "index.jsonl"
+BENCH_BEST_FILE = "bench_best_match.npy"
+_DTYPE = np.float32
+
+
+def run_matrices_folder(run_id, results_dir: str = None) -> str:
+    return os.path.join(results_dir or RESULTS_DIR, f"validation_matrices_{run_id}")
+
+
+def _read_index(folder: str) -> list:
+    """Complete index entries, in the order they were written."""
+    path = os.path.join(folder, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            entries.append(json.loads(line))
+    return entries
+
+
+def _entry_end(entry: dict) -> int:
+    rows, cols = entry["shape"]
+    return max((offset + rows * cols for offset in entry["outputs"].values()), default=0)
+
+
+class MatrixStoreWriter:
+    def __init__(self, folder: str, append: bool = False):
+        """Start a store in ``folder``, or with ``append`` continue the one already there."""
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        data_path, index_path = os.path.join(folder, DATA_FILE), os.path.join(folder, INDEX_FILE)
+        self._offset = 0
+        if append and os.path.exists(index_path):
+            entries = _read_index(folder)
+            self._offset = max((_entry_end(e) for e in entries), default=0)
+            # Drop whatever a crash left after the last complete row
+            with open(index_path, "r+b") as f:
+                f.truncate(sum(len(line) for line in f if line.endswith(b"\n")))
+            if os.path.exists(data_path):
+                with open(data_path, "r+b") as f:
+                    f.truncate(self._offset * np.dtype(_DTYPE).itemsize)
+            mode = "ab"
+        else:
+            mode = "wb"
+        self._data = open(data_path, mode)
+        self._index = open(index_path, mode.replace("b", ""), encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def add(self, row: int, generated: list, gold: list, matrices: dict,
+            project: str = None, row_hash: str = None) -> None:
+        """Append the ``matrices`` (output name -> generated x gold array) of one row."""
+        shape = (len(generated), len(gold))
+        with self._lock:
+            offsets = {}
+            for name, matrix in matrices.items():
+                matrix = np.ascontiguousarray(matrix, dtype=_DTYPE)
+                if matrix.shape != shape:
+                    continue
+                self._data.write(matrix.tobytes())
+                offsets[name] = self._offset
+                self._offset += matrix.size
+            self._data.flush()
+            entry = {"row": int(row), "project": project, "row_hash": row_hash,
+                     "generated": list(generated), "gold": list(gold), "shape": shape, "outputs": offsets}
+            self._index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._index.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            for f in (self._data, self._index):
+                if not f.closed:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MatrixStore:
+    """Read side of a run folder; a row written more than once (resumed runs) keeps its last entry."""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._entries = {e["row"]: e for e in _read_index(folder)}
+        data_path = os.path.join(folder, DATA_FILE)
+        size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        self._data = (np.memmap(data_path, dtype=_DTYPE, mode="r") if size
+                      else np.empty(0, dtype=_DTYPE))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def rows(self, project: str = None) -> list:
+        return sorted(r for r, e in self._entries.items() if project is None or e["project"] == project)
+
+    def projects(self) -> list:
+        return sorted({e["project"] for e in self._entries.values() if e["project"] is not None})
+
+    def outputs(self) -> list:
+        return sorted({name for e in self._entries.values() for name in e["outputs"]})
+
+    def entry(self, row: int) -> dict:
+        """Index entry of ``row`` (CQs, shape, project, row hash); KeyError if it was not stored."""
+        return self._entries[row]
+
+    def matrix(self, row: int, output: str) -> np.ndarray:
+        """Read-only view of one matrix; KeyError if the row or output was not stored."""
+        entry = self._entries[row]
+        rows, cols = entry["shape"]
+        offset = entry["outputs"][output]
+        return self._data[offset:offset + rows * cols].reshape(rows, cols)
+
+    def best_match(self, row: int, output: str = "cosine") -> np.ndarray:
+        """Best score of each generated CQ of ``row`` against the gold CQs."""
+        matrix = self.matrix(row, output)
+        return matrix.max(axis=1) if matrix.size else np.empty(0, dtype=_DTYPE)
+
+
+def load_run_matrices(run_id, results_dir: str = None) -> MatrixStore:
+    """Open the matrix store of run ``run_id``; FileNotFoundError if it has none."""
+    folder = run_matrices_folder(run_id, results_dir)
+    if not os.path.exists(os.path.join(folder, INDEX_FILE)):
+        raise FileNotFoundError(f"No matrix store for run {run_id} in {folder}.")
+    return MatrixStore(folder)
+
+
+def save_bench_best_match(folder: str, best_per_bench) -> None:
+    os.makedirs(folder, exist_ok=True)
+    np.save(os.path.join(folder, BENCH_BEST_FILE), np.asarray(best_per_bench, dtype=_DTYPE))
+
+
+def load_bench_best_match(run_id, results_dir: str = None):
+    """Best tool-CQ score of each benchmark CQ saved for run ``run_id``, or None."""
+    path = os.path.join(run_matrices_folder(run_id, results_dir), BENCH_BEST_FILE)
+    return np.load(path) if os.path.exists(path) else None
@@ -0,0 +1,317 @@
+"""Registry of the metrics CQValidator can compute.
+
+Each metric declares what it needs (``requires``), whether it scores a whole
+generated x gold cross product in one call (``batched``) and a relative
+``cost``. validate(), aggregate_dataframe_metrics() and the per-project summary
+all go through this registry, and the scheduler runs dependencies first and
+cheap metrics before expensive ones. New metrics are added with
+``register_metric`` and cost nothing to modes that do not ask for them.
+Pair scores already computed by the current run (``reuse`` metrics), or kept
+in the persistent pair-score cache (metrics with a ``cache_version``), are
+reused, so only pairs never seen before are computed.
+"""
+import math
+import logging
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from app.services.bertscore import bertscore_matrices, bertscore_version
+from app.services.text_metrics import jaccard_matrix, bleu_matrix, rouge_l_matrix
+from app.services.pair_score_cache import get_pair_score_cache
+
+logger = logging.getLogger(__name__)
+
+# A compute function sets this output to keep its (e.g. fallback) scores out of the pair-score cache
+NO_CACHE = "_no_cache"
+
+
+class Metric:
+    """A named metric between the generated CQs (rows) and the gold CQs (columns).
+
+    ``compute(ctx, outputs)`` returns a dict of new outputs (usually matrices)
+    given the row context and the outputs of the metrics it requires;
+    ``summarize(outputs)`` turns them into result keys. ``matrix`` names the
+    output used for project-level aggregation (``pairwise_key``) and heatmaps.
+    ``matrices`` lists every generated x gold output; when ``cache_version`` (a
+    string, or a callable returning one) is set, those are read from and written
+    to the pair-score cache under that version; only metrics that cost more to
+    compute than a cache lookup (BERTScore) set one. ``reuse`` metrics look
+    their pairs up in (and record them to) the run's result store; cosine
+    (over cached embeddings) and the lexical metrics are cheaper to recompute
+    and opt out. ``remote`` metrics call an external service (an LLM) and may
+    run concurrently with other rows' metrics.
+    ``result_keys`` lists every key ``summarize`` returns (default: ``summary_keys``).
+    """
+
+    def __init__(self, name: str, compute, summarize, cost: int, requires: tuple = (),
+                 batched: bool = True, matrix: str = None, pairwise_key: str = None,
+                 label: str = None, summary_keys: tuple = (), matrices: tuple = None,
+                 cache_version=None, remote: bool = False, result_keys: tuple = None,
+                 reuse: bool = True):
+        self.name = name
+        self.compute = compute
+        self.summarize = summarize
+        self.cost = cost
+        self.requires = tuple(requires)
+        self.batched = batched
+        self.matrix = matrix
+        self.pairwise_key = pairwise_key
+        self.label = label
+        self.summary_keys = tuple(summary_keys)
+        self.matrices = tuple(matrices) if matrices is not None else ((matrix,) if matrix else ())
+        self.cache_version = cache_version
+        self.remote = remote
+        self.result_keys = tuple(result_keys) if result_keys is not None else self.summary_keys
+        self.reuse = reuse
+
+
+METRIC_REGISTRY: dict = {}
+
+
+def register_metric(metric: Metric) -> Metric:
+    METRIC_REGISTRY[metric.name] = metric
+    return metric
+
+
+def _nn(x):
+    return None if (x is None or (isinstance(x, float) and math.isnan(x))) else x
+
+
+def _mean(mat):
+    return _nn(float(np.mean(mat))) if mat is not None and mat.size else None
+
+
+def _max(mat):
+    return _nn(float(np.max(mat))) if mat is not None and mat.size else None
+
+
+# --- built-in metrics ---
+
+def _compute_cosine(ctx, outputs):
+    gen, gold = ctx["generated"], ctx["gold"]
+    embeddings = ctx["encode"](gen + gold)
+    return {"cosine": cosine_similarity(embeddings[:len(gen)], embeddings[len(gen):])}
+
+
+def _summarize_cosine(outputs):
+    mat = outputs["cosine"]
+    best_vec = mat.max(axis=1) if mat.size else np.array([])
+    matches = int((best_vec >= 0.6).sum()) if best_vec.size else 0
+    return {
+        "Average Cosine Similarity": _mean(mat),
+        "Max Cosine Similarity": _max(mat),
+        "Best-match Cosines": best_vec.tolist(),
+        "Matches@0.6": matches,
+        "Precision@0.6": float(matches) / float(best_vec.size) if best_vec.size else 0.0,
+    }
+
+
+def _compute_bertscore(ctx, outputs):
+    try:
+        P, R, F1 = bertscore_matrices(ctx["generated"], ctx["gold"], batch_size=ctx.get("bertscore_batch_size"),
+                                      raise_errors=True)
+    except Exception as e:
+        logger.warning("BERTScore computation failed: %s", e)
+        zeros = np.zeros((len(ctx["generated"]), len(ctx["gold"])))
+        return {"bertscore_precision": zeros, "bertscore_recall": zeros, "bertscore_f1": zeros, NO_CACHE: True}
+    return {"bertscore_precision": P, "bertscore_recall": R, "bertscore_f1": F1}
+
+
+def _summarize_bertscore(outputs):
+    return {
+        "Average BERTScore-F1": _mean(outputs["bertscore_f1"]),
+        "Max BERTScore-F1": _max(outputs["bertscore_f1"]),
+        "Average BERTScore-Precision": _mean(outputs["bertscore_precision"]),
+        "Average BERTScore-Recall": _mean(outputs["bertscore_recall"]),
+    }
+
+
+register_metric(Metric(
+    "cosine", _compute_cosine, _summarize_cosine, cost=2,
+    matrix="cosine", label="Cosine",
+    summary_keys=("Average Cosine Similarity", "Max Cosine Similarity", "Precision@0.6", "Matches@0.6"),
+    result_keys=("Average Cosine Similarity", "Max Cosine Similarity", "Best-match Cosines",
+                 "Matches@0.6", "Precision@0.6"), reuse=False,
+))
+register_metric(Metric(
+    "jaccard",
+    lambda ctx, outputs: {"jaccard": jaccard_matrix(ctx["generated"], ctx["gold"])},
+    lambda outputs: {"Average Jaccard Similarity": _mean(outputs["jaccard"])},
+    cost=1, matrix="jaccard", pairwise_key="pairwise_Jaccard", label="Jaccard",
+    summary_keys=("Average Jaccard Similarity",), reuse=False,
+))
+register_metric(Metric(
+    "bleu",
+    lambda ctx, outputs: {"bleu": bleu_matrix(ctx["generated"], ctx["gold"])},
+    lambda outputs: {"Average BLEU": _mean(outputs["bleu"]), "Max BLEU": _max(outputs["bleu"])},
+    cost=1, matrix="bleu", pairwise_key="pairwise_BLEU",
+    summary_keys=("Average BLEU", "Max BLEU"), reuse=False,
+))
+register_metric(Metric(
+    "rouge",
+    lambda ctx, outputs: {"rouge_l_f1": rouge_l_matrix(ctx["generated"], ctx["gold"])},
+    lambda outputs: {"Average ROUGE-L F1": _mean(outputs["rouge_l_f1"]),
+                     "Max ROUGE-L F1": _max(outputs["rouge_l_f1"])},
+    cost=1, matrix="rouge_l_f1", pairwise_key="pairwise_ROUGE_L_F1",
+    summary_keys=("Average ROUGE-L F1", "Max ROUGE-L F1"), reuse=False,
+))
+register_metric(Metric(
+    "bertscore", _compute_bertscore, _summarize_bertscore, cost=50,
+    matrix="bertscore_f1", pairwise_key="pairwise_BERTScore_F1",
+    summary_keys=("Average BERTScore-F1", "Max BERTScore-F1",
+                  "Average BERTScore-Precision", "Average BERTScore-Recall"),
+    matrices=("bertscore_precision", "bertscore_recall", "bertscore_f1"), cache_version=bertscore_version,
+))
+# The analysis prompt quotes every similarity statistic, so it needs all matrices.
+register_metric(Metric(
+    "llm_analysis",
+    lambda ctx, outputs: {"llm_analysis": ctx["validator"].llm_analysis(ctx["generated"], ctx["gold"], outputs)},
+    lambda outputs: {"LLM Analysis": outputs["llm_analysis"]},
+    cost=1000, requires=("cosine", "jaccard", "bertscore", "bleu", "rouge"), batched=False, remote=True,
+    result_keys=("LLM Analysis",),
+))
+register_metric(Metric(
+    "llm_judge",
+    lambda ctx, outputs: {"llm_judge": [
+        {"Relevance": int(r["Relevance"]), "Clarity": int(r["Clarity"]),
+         "Depth": int(r["Depth"]), "Average": float(r["Average"])}
+        for r in ctx["validator"].llm_judge_scores(ctx["generated"]).to_dict(orient="records")
+    ]},
+    lambda outputs: {"LLM_as_Judge": outputs["llm_judge"]},
+    cost=1000, batched=False, remote=True, result_keys=("LLM_as_Judge",),
+))
+
+
+def compute_metric(name: str, ctx: dict, outputs: dict) -> dict:
+    """Run metric ``name`` on ``ctx``, reusing pair scores that are already known.
+
+    Pairs are looked up first in the run's result store (``ctx["run_store"]``,
+    ``reuse`` metrics) and then in the persistent pair-score cache (metrics
+    with a ``cache_version``). Only the generated x gold sub-block covering the
+    remaining pairs is computed, and the new scores are written back to both
+    unless ``ctx["record_scores"]`` is false (project-level blocks, whose pairs
+    are mostly never seen again).
+    """
+    metric = METRIC_REGISTRY[name]
+    run_store = ctx.get("run_store") if metric.reuse and metric.matrices else None
+    cache = get_pair_score_cache() if metric.cache_version and metric.matrices else None
+    if run_store is None and cache is None:
+        new = metric.compute(ctx, outputs)
+        new.pop(NO_CACHE, None)
+        return new
+
+    version = metric.cache_version() if callable(metric.cache_version) else metric.cache_version
+    gen, gold = ctx["generated"], ctx["gold"]
+    shape = (len(gen), len(gold))
+    known = {out: np.zeros(shape) for out in metric.matrices}
+    in_run = np.ones(shape, dtype=bool)
+    found = np.ones(shape, dtype=bool)
+    for out in metric.matrices:
+        mask = np.zeros(shape, dtype=bool)
+        if run_store is not None:
+            known[out], mask = run_store.get_matrix(out, gen, gold)
+            in_run &= mask
+        if cache is not None and not mask.all():
+            cached, cached_mask = cache.get_matrix(out, version, gen, gold)
+            take = cached_mask & ~mask
+            known[out][take] = cached[take]
+            mask = mask | cached_mask
+        found &= mask
+    if run_store is None:
+        in_run[:] = False
+
+    new = {}
+    record = ctx.get("record_scores", True)
+    skip_cache = False
+    if not found.all():
+        rows = np.flatnonzero(~found.all(axis=1))
+        cols = np.flatnonzero(~found.all(axis=0))
+        sub_ctx = dict(ctx, generated=[gen[i] for i in rows], gold=[gold[j] for j in cols])
+        new = metric.compute(sub_ctx, outputs)
+        skip_cache = new.pop(NO_CACHE, False)
+        block = np.ix_(rows, cols)
+        for out in metric.matrices:
+            known[out][block] = new.pop(out)
+            if cache is not None and record and not skip_cache:
+                cache.put_matrix(out, version, sub_ctx["generated"], sub_ctx["gold"], known[out][block],
+                                 mask=~found[block])
+    if run_store is not None and record:
+        keep = ~in_run & (found if skip_cache else True)
+        for out in metric.matrices:
+            run_store.put_matrix(out, gen, gold, known[out], mask=keep)
+    known.update(new)
+    return known
+
+
+# --- planning ---
+
+# Metrics reported by each validation mode.
+MODE_METRICS = {
+    "cosine": ("cosine",),
+    "jaccard": ("jaccard",),
+    "bertscore": ("bertscore",),
+    "llm": ("llm_analysis",),
+    "cosine_bertscore_judge": ("cosine", "bertscore", "llm_analysis", "llm_judge"),
+    "all": ("llm_analysis", "cosine", "jaccard", "bertscore", "bleu", "rouge"),
+}
+
+_MODE_HEATMAPS = {"cosine": ("cosine",), "jaccard": ("jaccard",), "all": ("cosine", "jaccard")}
+
+
+def schedule(names) -> list:
+    """Order metrics so that requirements come first and, among ready ones, cheaper first."""
+    pending = set(names)
+    stack = list(pending)
+    while stack:
+        for dep in METRIC_REGISTRY[stack.pop()].requires:
+            if dep not in pending:
+                pending.add(dep)
+                stack.append(dep)
+    order = []
+    while pending:
+        ready = [n for n in pending if all(d in order for d in METRIC_REGISTRY[n].requires)]
+        nxt = min(ready, key=lambda n: (METRIC_REGISTRY[n].cost, n))
+        order.append(nxt)
+        pending.discard(nxt)
+    return order
+
+
+def plan_validation(validation_mode: str, metrics: list = None) -> dict:
+    """Work out what validate() must compute for a mode or an explicit metric list.
+
+    Returns ``report`` (metrics whose keys appear in the result), ``order``
+    (report plus dependencies, in execution order), ``compute`` (the same as a
+    set), ``heatmaps`` (metrics whose matrix is rendered) and the split of
+    ``order`` into ``local`` metrics and ``remote`` ones (LLM calls and whatever
+    depends on them). Unknown modes and metrics raise ``ValueError``.
+    """
+    if validation_mode not in MODE_METRICS:
+        raise ValueError(f"Unknown validation_mode {validation_mode!r}; choose from {list(MODE_METRICS)}.")
+    mode = validation_mode
+    report = list(dict.fromkeys(metrics)) if metrics else list(MODE_METRICS[mode])
+    unknown = [m for m in report if m not in METRIC_REGISTRY]
+    if unknown:
+        raise ValueError(f"Unknown metric(s) {unknown}; choose from {list(METRIC_REGISTRY)}.")
+    order = schedule(report)
+    heatmaps = [h for h in _MODE_HEATMAPS.get(mode, ()) if h in report]
+    remote = []
+    for name in order:
+        metric = METRIC_REGISTRY[name]
+        if metric.remote or any(dep in remote for dep in metric.requires):
+            remote.append(name)
+    local = [name for name in order if name not in remote]
+    return {"report": report, "order": order, "compute": set(order), "heatmaps": heatmaps,
+            "local": local, "remote": remote}
+
+
+def summary_columns(names=None) -> list:
+    """Numeric per-row result keys of ``names`` (default: all metrics), for per-project summaries."""
+    metrics = METRIC_REGISTRY.values() if names is None else [METRIC_REGISTRY[n] for n in names]
+    return [k for m in metrics for k in m.summary_keys]
+
+
+def result_columns(plan: dict) -> list:
+    """Keys of a validate() result under ``plan``, in the order they appear."""
+    keys = [k for name in plan["order"] if name in plan["report"] for k in METRIC_REGISTRY[name].result_keys]
+    return keys + [f"{METRIC_REGISTRY[name].label} Heatmap" for name in plan["heatmaps"]]
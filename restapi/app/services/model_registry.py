@@ -0,0 +1,58 @@
+"""Process-wide registry of the models used by the validation services.
+
+Every model is loaded at most once per process, either eagerly at FastAPI
+startup (``preload_models``) or lazily on first use, and the same handle is
+shared by CQValidator, HitRateEvaluator and the metric scorers.
+"""
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+from app.config import SBERT_MODEL, BERTSCORE_MODEL, BERTSCORE_BATCH_SIZE
+
+_models: dict = {}
+_locks: dict = {}
+_registry_lock = threading.Lock()
+
+
+def _load_once(key: tuple, factory):
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _models:
+            logger.info("Loading model %s", key)
+            _models[key] = factory()
+    return _models[key]
+
+
+def get_sbert_model(name: str = SBERT_MODEL):
+    from sentence_transformers import SentenceTransformer
+    return _load_once(("sbert", name), lambda: SentenceTransformer(name))
+
+
+def get_bert_scorer(model_type: str = BERTSCORE_MODEL):
+    from bert_score import BERTScorer
+    return _load_once(("bertscore", model_type),
+                      lambda: BERTScorer(model_type=model_type, lang="en", batch_size=BERTSCORE_BATCH_SIZE))
+
+
+def get_rouge_scorer():
+    """Shared ROUGE-Lsum scorer, or None when rouge_score is not installed."""
+    try:
+        from rouge_score import rouge_scorer
+    except Exception:
+        return None
+    return _load_once(("rouge", "rougeLsum"), lambda: rouge_scorer.RougeScorer(["rougeLsum"], use_stemmer=True))
+
+
+def preload_models() -> None:
+    """Load every registered model up front; failures are logged, not raised."""
+    for loader in (get_sbert_model, get_bert_scorer, get_rouge_scorer):
+        try:
+            loader()
+        except Exception as e:
+            logger.warning("Could not preload %s: %s", loader.__name__, e)
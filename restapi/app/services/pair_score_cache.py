@@ -0,0 +1,136 @@
+"""Persistent cache of pairwise metric scores, backed by SQLite.
+
+One row per (metric, version, generated CQ, gold CQ), where the CQs are
+identified by the SHA-1 of their exact text and ``version`` pins whatever the
+score depends on besides the two texts (model name, library version, ...).
+Lookups and inserts work on a whole generated x gold block at once: the
+block's keys go into two temporary tables and a single join returns every
+cached pair, which is scattered into the result matrix. WAL mode lets
+several workers read while one writes.
+"""
+import os
+import sqlite3
+import hashlib
+import threading
+import logging
+
+import numpy as np
+
+from app.config import PAIR_SCORE_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha1(str(text).encode("utf-8")).digest()
+
+
+def _unique_keys(texts: list) -> tuple:
+    """Distinct text keys in first-seen order, and the index of each text's key."""
+    keys: dict = {}
+    index = np.fromiter((keys.setdefault(text_key(t), len(keys)) for t in texts), dtype=np.int64, count=len(texts))
+    return list(keys), index
+
+
+class PairScoreCache:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pair_scores ("
+            " metric TEXT NOT NULL, version TEXT NOT NULL, gen BLOB NOT NULL, gold BLOB NOT NULL,"
+            " value REAL NOT NULL, PRIMARY KEY (metric, version, gen, gold)) WITHOUT ROWID"
+        )
+        # Per-connection scratch tables holding the keys of the block being looked up
+        for table in ("query_gen", "query_gold"):
+            self._conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {table} (key BLOB PRIMARY KEY, idx INTEGER NOT NULL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.inserts = 0
+
+    def get_matrix(self, metric: str, version: str, generated: list, gold: list):
+        """Cached scores for every (generated, gold) pair.
+
+        Returns ``(matrix, found)``: a float matrix of shape
+        (len(generated), len(gold)) and a boolean mask of the pairs that were
+        in the cache; missing entries are left at zero.
+        """
+        gen_keys, gen_index = _unique_keys(generated)
+        gold_keys, gold_index = _unique_keys(gold)
+        if not gen_keys or not gold_keys:
+            return np.zeros((len(generated), len(gold))), np.zeros((len(generated), len(gold)), dtype=bool)
+
+        with self._lock:
+            with self._conn:
+                for table, keys in (("query_gen", gen_keys), ("query_gold", gold_keys)):
+                    self._conn.execute(f"DELETE FROM {table}")
+                    self._conn.executemany(f"INSERT INTO {table} VALUES (?, ?)", zip(keys, range(len(keys))))
+                # CROSS JOIN keeps query_gen outermost, so pair_scores is searched by its key prefix
+                cached = self._conn.execute(
+                    "SELECT g.idx, r.idx, p.value FROM query_gen g"
+                    " CROSS JOIN pair_scores p ON p.metric = ? AND p.version = ? AND p.gen = g.key"
+                    " JOIN query_gold r ON r.key = p.gold", (metric, version)).fetchall()
+        # Scatter into the unique-text block, then expand to the (possibly repeated) CQs
+        values = np.zeros((len(gen_keys), len(gold_keys)))
+        known = np.zeros(values.shape, dtype=bool)
+        if cached:
+            cached = np.array(cached)
+            i, j = cached[:, 0].astype(np.int64), cached[:, 1].astype(np.int64)
+            values[i, j] = cached[:, 2]
+            known[i, j] = True
+        block = np.ix_(gen_index, gold_index)
+        matrix, found = values[block], known[block]
+        with self._lock:
+            self.hits += int(found.sum())
+            self.misses += int(found.size - found.sum())
+        return matrix, found
+
+    def put_matrix(self, metric: str, version: str, generated: list, gold: list,
+                   matrix: np.ndarray, mask: np.ndarray = None) -> None:
+        """Store ``matrix[i, j]`` for every pair (or only where ``mask`` is set), in one transaction."""
+        gen_keys = [text_key(s) for s in generated]
+        gold_keys = [text_key(s) for s in gold]
+        ii, jj = np.nonzero(mask) if mask is not None else np.indices(matrix.shape).reshape(2, -1)
+        rows = [(metric, version, gen_keys[i], gold_keys[j], value)
+                for i, j, value in zip(ii.tolist(), jj.tolist(), np.asarray(matrix)[ii, jj].tolist())]
+        if not rows:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO pair_scores VALUES (?, ?, ?, ?, ?)", rows)
+            self.inserts += len(rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+                "inserts": self.inserts,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_pair_score_cache(path: str = PAIR_SCORE_CACHE_PATH):
+    """Shared pair-score cache, or None when it is disabled (empty path) or cannot be opened."""
+    global _cache
+    if not path:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != path:
+            try:
+                _cache = PairScoreCache(path)
+            except Exception as e:
+                logger.warning("Pair-score cache unavailable at %s: %s", path, e)
+                return None
+        return _cache
@@ -0,0 +1,178 @@
+"""Row-parallel validation on a process pool, and LLM pipelining within a process.
+
+The parent encodes every distinct CQ of the dataset once and publishes the
+embedding matrix in shared memory; workers attach to it instead of receiving
+pickled arrays, so they never load SBERT themselves. In a single process, the
+LLM calls of a row run on a thread pool while the next rows' metrics are
+computed. Either way results are yielded in row order, which keeps the output
+and the incremental saves deterministic.
+"""
+import os
+import logging
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from app.services.cq_validator import CQValidator
+from app.services.embedding_store import encode_sentences
+from app.utils.llm_clients import llm_concurrency
+
+from app.config import (VALIDATION_WORKERS, VALIDATION_MEMORY_BYTES, BERTSCORE_WORKER_BYTES,
+                        BERTSCORE_CACHE_BYTES)
+
+logger = logging.getLogger(__name__)
+
+# Per-process state of a pool worker, set up once by _init_worker
+_worker: dict = {}
+
+
+def validate_row(validator: CQValidator, gold, generated) -> dict:
+    """validate() one row, turning a failure into an ``Error`` entry."""
+    try:
+        return validator.validate(gold, generated)
+    except Exception as e:
+        return {"Error": str(e)}
+
+
+def _finish_row(validator: CQValidator, state: dict) -> dict:
+    try:
+        return validator.finish_validation(state)
+    except Exception as e:
+        return {"Error": str(e)}
+
+
+def _validate_rows_pipelined(validator: CQValidator, rows: list):
+    """Run each row's local metrics here and its LLM calls on a thread pool.
+
+    At most ``llm_concurrency()`` rows wait on the LLM at any time, so the
+    local work runs that many rows ahead of the oldest pending call.
+    """
+    depth = llm_concurrency()
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=depth) as pool:
+        for gold, generated in rows:
+            try:
+                pending.append(pool.submit(_finish_row, validator, validator.start_validation(gold, generated)))
+            except Exception as e:
+                failed = Future()
+                failed.set_result({"Error": str(e)})
+                pending.append(failed)
+            while pending and (len(pending) > depth or pending[0].done()):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _shared_encoder(vectors: np.ndarray, index: dict):
+    def encode(sentences: list) -> np.ndarray:
+        rows = [index.get(s) for s in sentences]
+        if all(r is not None for r in rows):
+            return vectors[rows] if rows else np.empty((0, vectors.shape[1]), dtype=vectors.dtype)
+        # Not published by the parent (should not happen): encode locally
+        return encode_sentences(sentences)
+    return encode
+
+
+def _init_worker(validator_kwargs: dict, shm_name: str, shape: tuple, index: dict, torch_threads: int) -> None:
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except Exception:
+        pass
+    encoder = None
+    if shm_name:
+        # Spawned workers share the parent's resource tracker, so the parent's unlink() covers them
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _worker["shm"] = shm
+        encoder = _shared_encoder(np.ndarray(shape, dtype=np.float32, buffer=shm.buf), index)
+    _worker["validator"] = CQValidator(**validator_kwargs, encoder=encoder)
+
+
+def _validate_in_worker(row: tuple):
+    validator = _worker["validator"]
+    result = validate_row(validator, *row)
+    return result, validator.run_store.export(clear=True)
+
+
+def resolve_workers(workers: int = None) -> int:
+    n = workers if workers is not None else VALIDATION_WORKERS
+    return max(1, min(int(n), os.cpu_count() or 1)) if n else 1
+
+
+def cap_workers_by_memory(workers: int, plan: dict) -> int:
+    """Workers that fit VALIDATION_MEMORY_BYTES when each loads its own BERTScore model and token cache."""
+    if workers <= 1 or "bertscore" not in plan["compute"]:
+        return workers
+    fits = max(1, VALIDATION_MEMORY_BYTES // max(1, BERTSCORE_WORKER_BYTES + BERTSCORE_CACHE_BYTES))
+    if fits < workers:
+        logger.info("BERTScore planned: %s workers instead of %s to stay within %s bytes",
+                    fits, workers, VALIDATION_MEMORY_BYTES)
+    return min(workers, fits)
+
+
+def validate_rows(validator: CQValidator, rows: list, workers: int = None):
+    """Yield the validation result of each ``(gold, generated)`` row, in input order.
+
+    With more than one worker the rows are spread over a process pool; pair
+    scores computed by the workers are merged into ``validator.run_store`` so
+    the aggregation stage can still reuse them. Otherwise, plans with LLM
+    metrics overlap those calls with the following rows' local metrics.
+    Every worker loads its own BERTScore model, so plans with BERTScore get
+    only as many workers as fit the memory budget (``cap_workers_by_memory``),
+    and rows are submitted a few per worker ahead of the one being yielded.
+    """
+    workers = cap_workers_by_memory(resolve_workers(workers), validator.plan)
+    if workers <= 1 or len(rows) < 2:
+        if validator.plan["remote"] and len(rows) > 1:
+            yield from _validate_rows_pipelined(validator, rows)
+            return
+        for gold, generated in rows:
+            yield validate_row(validator, gold, generated)
+        return
+
+    shm, shape, index = None, (0, 0), {}
+    if "cosine" in validator.plan["compute"]:
+        sentences = list(dict.fromkeys(
+            q for row in rows for text in row if not pd.isna(text) for q in validator.split_cqs(text)
+        ))
+        vectors = np.ascontiguousarray(validator._encode_with_cache(sentences), dtype=np.float32)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, vectors.nbytes))
+        np.ndarray(vectors.shape, dtype=np.float32, buffer=shm.buf)[:] = vectors
+        shape, index = vectors.shape, {s: i for i, s in enumerate(sentences)}
+
+    validator_kwargs = {
+        "output_folder": validator.output_folder, "model": validator.model,
+        "validation_mode": validator.validation_mode, "metrics": validator.metrics,
+        "bertscore_batch_size": validator.bertscore_batch_size,
+        "keep_matrices": validator.keep_matrices,
+        # Workers are already off the critical path; no render pool per worker
+        "heatmap_mode": "sync" if validator.heatmap_mode == "background" else validator.heatmap_mode,
+    }
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    logger.info("Validating %s rows on %s worker processes", len(rows), workers)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            # spawn: forking a process that already runs torch threads can deadlock
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(validator_kwargs, shm.name if shm else None, shape, index, torch_threads),
+        ) as pool:
+            remaining = iter(rows)
+            pending = deque(pool.submit(_validate_in_worker, row)
+                            for row in itertools.islice(remaining, 2 * workers))
+            while pending:
+                result, scores = pending.popleft().result()
+                for row in itertools.islice(remaining, 1):
+                    pending.append(pool.submit(_validate_in_worker, row))
+                validator.run_store.merge(scores)
+                yield result
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
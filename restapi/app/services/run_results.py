@@ -0,0 +1,131 @@
+import threading
+
+import numpy as np
+
+# A pair is keyed by (generated id << _ID_BITS) | gold id
+_ID_BITS = 32
+_LOW = (1 << _ID_BITS) - 1
+
+
+def _sorted_run(keys: np.ndarray, values: np.ndarray) -> tuple:
+    """Sort ``keys`` and drop repeats, keeping the first value of each key."""
+    keys, first = np.unique(keys, return_index=True)
+    return keys, values[first]
+
+
+class RunResultStore:
+    """Pair scores produced during one validation run, shared by its stages.
+
+    The row stage records every generated x gold matrix it computes; the
+    project-level aggregation then only has to compute pairs no row has
+    scored. Same block interface as ``PairScoreCache``, but in memory and not
+    versioned: everything in it was computed by this run's models.
+
+    Sentences get integer ids and a pair is an int64 key made of its two ids.
+    Each output keeps a few sorted runs of keys (with float32 values), merged
+    like a binary counter so there are O(log pairs) of them; a block is looked
+    up with one ``searchsorted`` per run over its id grid. Memory grows with
+    the pairs actually scored: rows of different projects never meet, so a
+    dense sentence x sentence matrix would be mostly empty.
+    """
+
+    def __init__(self):
+        self._ids: dict = {}
+        self._runs: dict = {}   # output -> [(sorted keys, values), ...], oldest and largest first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _sentence_ids(self, sentences: list, add: bool) -> np.ndarray:
+        """Id of each sentence; unknown ones get a new id with ``add``, else -1."""
+        if add:
+            return np.fromiter((self._ids.setdefault(s, len(self._ids)) for s in sentences),
+                               dtype=np.int64, count=len(sentences))
+        return np.fromiter((self._ids.get(s, -1) for s in sentences), dtype=np.int64, count=len(sentences))
+
+    def _add(self, output: str, keys: np.ndarray, values: np.ndarray) -> None:
+        if not keys.size:
+            return
+        runs = self._runs.setdefault(output, [])
+        keys, values = _sorted_run(keys, np.asarray(values, dtype=np.float32))
+        # Newer scores come first, so they win the merge
+        while runs and runs[-1][0].size <= 2 * keys.size:
+            old_keys, old_values = runs.pop()
+            keys, values = _sorted_run(np.concatenate([keys, old_keys]), np.concatenate([values, old_values]))
+        runs.append((keys, values))
+
+    def _compact(self, output: str) -> tuple:
+        runs = self._runs.get(output, [])
+        if len(runs) > 1:
+            keys, values = _sorted_run(np.concatenate([k for k, _ in runs[::-1]]),
+                                       np.concatenate([v for _, v in runs[::-1]]))
+            runs[:] = [(keys, values)]
+        return runs[0] if runs else (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+
+    def get_matrix(self, output: str, generated: list, gold: list):
+        """Return ``(matrix, found)`` for every (generated, gold) pair; missing entries are zero."""
+        matrix = np.zeros((len(generated), len(gold)))
+        found = np.zeros(matrix.shape, dtype=bool)
+        with self._lock:
+            runs = self._runs.get(output)
+            if runs and matrix.size:
+                gen_ids, gold_ids = self._sentence_ids(generated, False), self._sentence_ids(gold, False)
+                rows, cols = np.flatnonzero(gen_ids >= 0), np.flatnonzero(gold_ids >= 0)
+                if rows.size and cols.size:
+                    wanted = (gen_ids[rows][:, None] << _ID_BITS) | gold_ids[cols][None, :]
+                    block_values = np.zeros(wanted.shape)
+                    block_found = np.zeros(wanted.shape, dtype=bool)
+                    for keys, values in reversed(runs):
+                        pos = np.minimum(np.searchsorted(keys, wanted), keys.size - 1)
+                        hit = (keys[pos] == wanted) & ~block_found
+                        block_values[hit] = values[pos[hit]]
+                        block_found |= hit
+                    block = np.ix_(rows, cols)
+                    matrix[block], found[block] = block_values, block_found
+            self.hits += int(found.sum())
+            self.misses += int(found.size - found.sum())
+        return matrix, found
+
+    def put_matrix(self, output: str, generated: list, gold: list,
+                   matrix: np.ndarray, mask: np.ndarray = None) -> None:
+        """Record ``matrix[i, j]`` for every pair, or only where ``mask`` is set."""
+        matrix = np.asarray(matrix)
+        with self._lock:
+            gen_ids, gold_ids = self._sentence_ids(generated, True), self._sentence_ids(gold, True)
+            keys = (gen_ids[:, None] << _ID_BITS) | gold_ids[None, :]
+            if mask is None:
+                self._add(output, keys.ravel(), matrix.ravel())
+            else:
+                self._add(output, keys[mask], matrix[mask])
+
+    def export(self, clear: bool = False) -> dict:
+        """Picklable copy (sentences and one key/value array pair per output), e.g. to ship back from a worker."""
+        with self._lock:
+            scores = {"sentences": list(self._ids),
+                      "outputs": {output: self._compact(output) for output in self._runs}}
+            if clear:
+                self._ids = {}
+                self._runs = {}
+        return scores
+
+    def merge(self, scores: dict) -> None:
+        """Add the pairs of another store's ``export()``, translating its sentence ids to ours."""
+        with self._lock:
+            remap = self._sentence_ids(scores["sentences"], True)
+            for output, (keys, values) in scores["outputs"].items():
+                self._add(output, (remap[keys >> _ID_BITS] << _ID_BITS) | remap[keys & _LOW], values)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "pairs": {output: int(self._compact(output)[0].size) for output in self._runs},
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids = {}
+            self._runs = {}
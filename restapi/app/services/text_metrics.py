@@ -0,0 +1,162 @@
+"""Matrix-level lexical similarity metrics between generated and gold CQs.
+
+Every function scores the full (candidates x references) cross product and
+tokenizes each unique sentence only once.
+"""
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+from app.services.model_registry import get_rouge_scorer
+
+try:
+    from rouge_score.rouge_scorer import _summary_level_lcs
+except Exception:
+    _summary_level_lcs = None
+
+_BLEU_WEIGHTS = (0.25, 0.25, 0.25, 0.25)
+_BLEU_EPSILON = 0.1  # nltk SmoothingFunction().method1
+
+
+def _incidence(token_sets: list, vocab: dict) -> sparse.csr_matrix:
+    indptr, indices = [0], []
+    for tokens in token_sets:
+        indices.extend(vocab[t] for t in tokens)
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.int32)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(token_sets), len(vocab)))
+
+
+def jaccard_matrix(cands: list, refs: list) -> np.ndarray:
+    """Whitespace-token Jaccard similarity for every (candidate, reference) pair.
+
+    Intersections come from one sparse product of binary token-incidence
+    matrices and unions from their row sums, so the result is identical to
+    ``len(a & b) / len(a | b)`` computed pair by pair (0.0 for empty unions).
+    """
+    shape = (len(cands), len(refs))
+    if not cands or not refs:
+        return np.zeros(shape)
+
+    cand_sets = [set(s.split()) for s in cands]
+    ref_sets = [set(s.split()) for s in refs]
+    vocab: dict = {}
+    for tokens in cand_sets + ref_sets:
+        for t in tokens:
+            vocab.setdefault(t, len(vocab))
+
+    A = _incidence(cand_sets, vocab)
+    B = _incidence(ref_sets, vocab)
+    inter = (A @ B.T).toarray().astype(np.float64)
+    union = np.array([len(s) for s in cand_sets])[:, None] + np.array([len(s) for s in ref_sets])[None, :] - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, inter / union, 0.0)
+
+
+def _count_matrix(counters: list, vocab: dict) -> sparse.csr_matrix:
+    indptr, indices, data = [0], [], []
+    for counts in counters:
+        for gram, c in counts.items():
+            indices.append(vocab.setdefault(gram, len(vocab)))
+            data.append(c)
+        indptr.append(len(indices))
+    return sparse.csr_matrix((np.array(data, dtype=np.int32), indices, indptr),
+                             shape=(len(counters), len(vocab)))
+
+
+def _clipped_matches(cand_counts: list, ref_counts: list) -> np.ndarray:
+    """sum_g min(cand[g], ref[g]) for every pair, as sum_k [cand >= k] . [ref >= k]."""
+    vocab: dict = {}
+    A = _count_matrix(cand_counts, vocab)
+    B = _count_matrix(ref_counts, vocab)
+    A.resize((A.shape[0], len(vocab)))
+    out = np.zeros((A.shape[0], B.shape[0]))
+    k_max = min(A.max() if A.nnz else 0, B.max() if B.nnz else 0)
+    for k in range(1, k_max + 1):
+        out += ((A >= k).astype(np.int32) @ (B >= k).astype(np.int32).T).toarray()
+    return out
+
+
+def bleu_matrix(cands: list, refs: list) -> np.ndarray:
+    """Sentence BLEU-4 of each candidate against each single reference.
+
+    Reproduces ``sentence_bleu([ref.split()], cand.split(),
+    smoothing_function=SmoothingFunction().method1)``: n-gram counts are built
+    once per sentence and the clipped matches of all pairs come from sparse
+    products, one per n-gram order and count level.
+    """
+    shape = (len(cands), len(refs))
+    if not cands or not refs:
+        return np.zeros(shape)
+
+    cand_tokens = [s.split() for s in cands]
+    ref_tokens = [s.split() for s in refs]
+    hyp_len = np.array([len(t) for t in cand_tokens], dtype=np.float64)[:, None]
+    ref_len = np.array([len(t) for t in ref_tokens], dtype=np.float64)[None, :]
+
+    log_p = np.zeros(shape)
+    unigram_hits = None
+    for n, weight in enumerate(_BLEU_WEIGHTS, start=1):
+        ngrams = lambda toks: Counter(zip(*(toks[i:] for i in range(n))))
+        matches = _clipped_matches([ngrams(t) for t in cand_tokens], [ngrams(t) for t in ref_tokens])
+        denom = np.maximum(1.0, hyp_len - n + 1)
+        p = np.where(matches == 0, _BLEU_EPSILON / denom, matches / denom)
+        log_p += weight * np.log(p)
+        if n == 1:
+            unigram_hits = matches
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bp = np.where(hyp_len > ref_len, 1.0, np.exp(1 - ref_len / hyp_len))
+    bp = np.where(hyp_len == 0, 0.0, bp)
+    return np.where(unigram_hits == 0, 0.0, bp * np.exp(log_p))
+
+
+def _lcs_length(ref_masks: dict, ref_len: int, cand_ids: list) -> int:
+    """Bit-parallel LCS length (Hyyrö 2004) of a candidate against a prepared reference."""
+    full = (1 << ref_len) - 1
+    v = full
+    for t in cand_ids:
+        u = v & ref_masks.get(t, 0)
+        v = ((v + u) | (v - u)) & full
+    return ref_len - bin(v).count("1")
+
+
+def rouge_l_matrix(cands: list, refs: list) -> np.ndarray:
+    """ROUGE-Lsum F1 of each candidate against each reference.
+
+    Reproduces ``RougeScorer(["rougeLsum"], use_stemmer=True).score(ref, cand)``:
+    every sentence is tokenized and stemmed once, mapped to integer ids, and
+    single-line pairs use a bit-parallel LCS. Multi-line texts fall back to
+    rouge_score's summary-level routine on the pre-tokenized lines.
+    """
+    shape = (len(cands), len(refs))
+    scorer = get_rouge_scorer()
+    if scorer is None or not cands or not refs:
+        return np.zeros(shape)
+
+    tokenizer = scorer._tokenizer
+    vocab: dict = {}
+    prepared = {}
+    for text in dict.fromkeys(list(cands) + list(refs)):
+        lines = [tokenizer.tokenize(x) for x in text.split("\n") if len(x)]
+        ids = [vocab.setdefault(t, len(vocab)) for t in lines[0]] if len(lines) == 1 else None
+        masks = {}
+        for pos, t in enumerate(ids or []):
+            masks[t] = masks.get(t, 0) | (1 << pos)
+        prepared[text] = (lines, ids, masks)
+
+    F1 = np.zeros(shape)
+    for j, ref in enumerate(refs):
+        ref_lines, ref_ids, ref_masks = prepared[ref]
+        for i, cand in enumerate(cands):
+            cand_lines, cand_ids, _ = prepared[cand]
+            if ref_ids is not None and cand_ids is not None:
+                if not ref_ids or not cand_ids:
+                    continue
+                hits = _lcs_length(ref_masks, len(ref_ids), cand_ids)
+                precision, recall = hits / len(cand_ids), hits / len(ref_ids)
+                F1[i, j] = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+            elif _summary_level_lcs is not None:
+                F1[i, j] = _summary_level_lcs(ref_lines, cand_lines).fmeasure
+    return F1
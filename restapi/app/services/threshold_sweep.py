@@ -0,0 +1,137 @@
+"""Precision, matches and coverage of a finished run over a grid of thresholds.
+
+Every curve comes from sorted best-match vectors: the number of scores at or
+above each threshold is one vectorized ``searchsorted``, so sweeping a whole
+grid costs about as much as sorting the scores once. Per-row scores come from
+the run's matrix store, or from the ``Best-match Cosines`` column of its results
+CSV for runs saved without one; coverage needs the per-benchmark-CQ vector the
+hit-rate phase saves next to the matrices.
+
+CLI (from ``restapi/``)::
+
+    python -m app.services.threshold_sweep <run_id> [--start 0 --stop 1 --num 101] [--by-project]
+"""
+import os
+import json
+import argparse
+
+import numpy as np
+
+from app.services.matrix_store import load_run_matrices, load_bench_best_match
+from app.utils.results_writer import read_results_csv
+
+from app.config import RESULTS_DIR
+
+
+def threshold_grid(start: float = 0.0, stop: float = 1.0, num: int = 101) -> np.ndarray:
+    return np.round(np.linspace(start, stop, num), 6)
+
+
+def _at_or_above(sorted_values: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """Index of the first value >= each threshold in ``sorted_values``."""
+    return np.searchsorted(sorted_values, thresholds, side="left")
+
+
+def sweep_best_matches(best_vectors: list, thresholds) -> dict:
+    """Curves over ``thresholds`` for rows given as best-match vectors (one score per generated CQ).
+
+    ``matches`` totals Matches@t over the rows, ``precision`` is the mean of
+    the rows' Precision@t (as in the per-project summaries) and
+    ``micro_precision`` is matches over all generated CQs.
+    """
+    thresholds = np.asarray(thresholds, dtype=float)
+    vectors = [np.asarray(v, dtype=float).ravel() for v in best_vectors]
+    vectors = [v for v in vectors if v.size]
+    if not vectors:
+        zeros = [0] * len(thresholds)
+        return {"matches": zeros, "precision": [0.0] * len(thresholds),
+                "micro_precision": [0.0] * len(thresholds), "rows": 0, "generated_cqs": 0}
+    values = np.concatenate(vectors)
+    # Each score weighs 1/len(row) towards the mean per-row precision
+    sizes = np.array([v.size for v in vectors])
+    weights = np.repeat(1.0 / sizes, sizes)
+    order = np.argsort(values, kind="stable")
+    values, weights = values[order], weights[order]
+    weight_above = np.concatenate([np.cumsum(weights[::-1])[::-1], [0.0]])
+    first = _at_or_above(values, thresholds)
+    matches = values.size - first
+    return {
+        "matches": matches.tolist(),
+        "precision": np.round(weight_above[first] / len(vectors), 6).tolist(),
+        "micro_precision": np.round(matches / values.size, 6).tolist(),
+        "rows": len(vectors),
+        "generated_cqs": int(values.size),
+    }
+
+
+def sweep_coverage(bench_best, thresholds) -> list:
+    """coverage_rate at each threshold: share of benchmark CQs whose best tool match reaches it."""
+    values = np.sort(np.asarray(bench_best, dtype=float).ravel())
+    if not values.size:
+        return [0.0] * len(thresholds)
+    covered = values.size - _at_or_above(values, np.asarray(thresholds, dtype=float))
+    return np.round(covered / values.size, 6).tolist()
+
+
+def _parse_vector(cell) -> np.ndarray:
+    if isinstance(cell, list):
+        return np.asarray(cell, dtype=float)
+    if isinstance(cell, str):
+        try:
+            return np.asarray(json.loads(cell), dtype=float)
+        except ValueError:
+            return np.empty(0)
+    return np.empty(0)
+
+
+def load_run_best_matches(run_id, results_dir: str = None) -> tuple:
+    """``(best-match vectors, projects)`` of a run's rows, from its matrix store or else its results CSV."""
+    results_dir = results_dir or RESULTS_DIR
+    try:
+        store = load_run_matrices(run_id, results_dir)
+        rows = [r for r in store.rows() if "cosine" in store.entry(r)["outputs"]]
+        return [store.best_match(r) for r in rows], [store.entry(r)["project"] for r in rows]
+    except FileNotFoundError:
+        pass
+    path = os.path.join(results_dir, f"validation_results_{run_id}.csv")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No results for run {run_id} in {results_dir}.")
+    df = read_results_csv(path)
+    if "Best-match Cosines" not in df.columns:
+        raise ValueError(f"Run {run_id} has no best-match cosines (cosine was not computed).")
+    projects = df["Project Name"].tolist() if "Project Name" in df.columns else [None] * len(df)
+    return [_parse_vector(c) for c in df["Best-match Cosines"]], projects
+
+
+def sweep_run(run_id, thresholds=None, by_project: bool = False, results_dir: str = None) -> dict:
+    """Threshold curves of a finished run (see ``sweep_best_matches``), plus ``coverage_rate`` when available."""
+    thresholds = threshold_grid() if thresholds is None else np.asarray(thresholds, dtype=float)
+    vectors, projects = load_run_best_matches(run_id, results_dir)
+    out = {"run_id": str(run_id), "thresholds": thresholds.tolist(), **sweep_best_matches(vectors, thresholds)}
+    bench_best = load_bench_best_match(run_id, results_dir)
+    out["coverage_rate"] = sweep_coverage(bench_best, thresholds) if bench_best is not None else None
+    if by_project:
+        groups: dict = {}
+        for vector, project in zip(vectors, projects):
+            groups.setdefault(str(project), []).append(vector)
+        out["by_project"] = {p: sweep_best_matches(v, thresholds) for p, v in groups.items()}
+    return out
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Threshold sweep over a finished validation run.")
+    parser.add_argument("run_id", help="Run id (as in the run's file names)")
+    parser.add_argument("--start", type=float, default=0.0)
+    parser.add_argument("--stop", type=float, default=1.0)
+    parser.add_argument("--num", type=int, default=101)
+    parser.add_argument("--thresholds", help="Comma-separated thresholds (overrides the grid)")
+    parser.add_argument("--by-project", action="store_true")
+    parser.add_argument("--results-dir", default=None)
+    args = parser.parse_args(argv)
+    thresholds = ([float(t) for t in args.thresholds.split(",")] if args.thresholds
+                  else threshold_grid(args.start, args.stop, args.num))
+    print(json.dumps(sweep_run(args.run_id, thresholds, args.by_project, args.results_dir), indent=2))
+
+
+if __name__ == "__main__":
+    main()
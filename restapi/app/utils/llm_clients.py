@@ -7,8 +7,12 @@ Uniform interface:
 """
 from typing import List, Dict, Optional
 import os
+import re
+import threading
 import requests
 
+from app.config import LLM_MAX_CONCURRENCY
+
 
 class BaseLLMClient:
     def chat_completion(self, messages: List[Dict], model: str, max_tokens: int = 3000, temperature: float = 0) -> str:
@@ -145,6 +149,26 @@ class DemoAdapter(BaseLLMClient):
         return f"[demo response] {joined}"[: max(0, max_tokens)]
 
 
+_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_semaphores_lock = threading.Lock()
+
+
+def llm_concurrency(provider: Optional[str] = None) -> int:
+    """Max in-flight requests to a provider: LLM_MAX_CONCURRENCY_<PROVIDER>, else LLM_MAX_CONCURRENCY (4)."""
+    provider = (provider or os.getenv("LLM_PROVIDER", "openai")).lower()
+    specific = os.getenv("LLM_MAX_CONCURRENCY_" + re.sub(r"[^A-Z0-9]+", "_", provider.upper()))
+    return max(1, int(specific or LLM_MAX_CONCURRENCY))
+
+
+def llm_semaphore(provider: Optional[str] = None) -> threading.BoundedSemaphore:
+    """Process-wide semaphore bounding concurrent calls to ``provider``."""
+    provider = (provider or os.getenv("LLM_PROVIDER", "openai")).lower()
+    with _semaphores_lock:
+        if provider not in _semaphores:
+            _semaphores[provider] = threading.BoundedSemaphore(llm_concurrency(provider))
+        return _semaphores[provider]
+
+
 def get_llm_client(provider: Optional[str] = None, **kwargs) -> BaseLLMClient:
     """Factory. Reads LLM_PROVIDER env var if provider is None (defaults to 'openai')."""
     if provider is None:
@@ -0,0 +1,246 @@
+"""Append-only CSV writer for validation results.
+
+The column list is fixed when the file is created. A row bringing a column
+nobody declared extends the schema instead of forcing a rewrite: the new
+values go at the end of the row and the full column list is kept in a
+``<file>.columns.json`` sidecar (``read_results_csv`` uses it), and the header
+line is brought up to date once, on close.
+
+Opened with ``append=True`` the writer continues an existing file, e.g. to
+resume an interrupted run: a last row cut short by a crash is dropped first,
+and with ``drop_failed`` so are the rows that ended in an error (the resumed
+run validates them again). Every row carries a ``Row Hash`` of its inputs
+(see ``row_hash``), which is how ``completed_results`` tells the rows a
+resumed run can skip. List and dict cells are written as JSON.
+"""
+import io
+import os
+import csv
+import ast
+import json
+import shutil
+import hashlib
+
+ROW_HASH_COLUMN = "Row Hash"
+
+
+def _sidecar_path(path: str) -> str:
+    return path + ".columns.json"
+
+
+def row_hash(gold, generated, validation_mode: str, model: str, metrics: list = None) -> str:
+    """Identify a validated row by everything its result depends on (``metrics``: an explicit metric list)."""
+    parts = [gold, generated, validation_mode, model]
+    if metrics:
+        parts.append(",".join(sorted(set(metrics))))
+    digest = hashlib.sha1("\x1f".join(str(p) for p in parts).encode("utf-8"))
+    return digest.hexdigest()[:20]
+
+
+def _cell(value):
+    return json.dumps(value, ensure_ascii=False, default=str) if isinstance(value, (list, dict)) else value
+
+
+def _read_columns(path: str) -> tuple:
+    """``(header, columns)`` of an existing file; they differ while the sidecar is there."""
+    with open(path, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f), [])
+    sidecar = _sidecar_path(path)
+    if os.path.exists(sidecar):
+        with open(sidecar, encoding="utf-8") as f:
+            return header, json.load(f)
+    return header, list(header)
+
+
+def _complete_text(path: str) -> tuple:
+    """``(text, truncated)``: the file up to its last complete record, which a crash may have cut short."""
+    with open(path, newline="", encoding="utf-8") as f:
+        lines = f.readlines()
+    reader = csv.reader(iter(lines), strict=True)
+    complete = 0
+    try:
+        for _ in reader:
+            complete = reader.line_num
+    except csv.Error:
+        pass
+    if complete == len(lines) and lines and not lines[-1].endswith("\n"):
+        complete -= 1
+    return "".join(lines[:complete]), complete < len(lines)
+
+
+def _drop_failed_rows(path: str, columns: list) -> int:
+    """Rewrite the file without its rows that have an ``Error``; returns how many were dropped."""
+    if "Error" not in columns:
+        return 0
+    error = columns.index("Error")
+    with open(path, newline="", encoding="utf-8") as f:
+        records = list(csv.reader(f))
+    kept = [r for r in records[1:] if not (len(r) > error and r[error])]
+    dropped = len(records) - 1 - len(kept)
+    if dropped:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(records[:1] + kept)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    return dropped
+
+
+def _drop_partial_row(path: str) -> bool:
+    """Truncate a last record left incomplete by a crash; True if one was dropped."""
+    text, truncated = _complete_text(path)
+    if truncated:
+        with open(path, "r+b") as f:
+            f.truncate(len(text.encode("utf-8")))
+    return truncated
+
+
+class ResultsCSVWriter:
+    def __init__(self, path: str, columns: list, fsync_every: int = 0, append: bool = False,
+                 drop_failed: bool = False):
+        """``fsync_every``: fsync after that many rows (0 = only on close); rows are flushed on every write.
+
+        With ``append`` an existing, non-empty file is continued instead of replaced;
+        ``drop_failed`` first removes its error rows, so re-running them leaves no duplicates.
+        """
+        self.path = path
+        self.columns = list(dict.fromkeys(columns))
+        self.header_columns = list(self.columns)
+        self.fsync_every = fsync_every
+        self.rows_written = 0
+        self._unsynced = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if append and os.path.exists(path) and os.path.getsize(path):
+            self.header_columns, existing = _read_columns(path)
+            _drop_partial_row(path)
+            if drop_failed:
+                _drop_failed_rows(path, existing)
+            self.columns = existing + [c for c in self.columns if c not in existing]
+            self._file = open(path, mode="a", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            if self.columns != existing:
+                self._write_sidecar()
+            return
+        self._file = open(path, mode="w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.header_columns)
+        self._file.flush()
+
+    def _write_sidecar(self) -> None:
+        with open(_sidecar_path(self.path), "w", encoding="utf-8") as f:
+            json.dump(self.columns, f)
+
+    def write_rows(self, rows: list) -> None:
+        if not rows:
+            return
+        new = [k for r in rows for k in r if k not in self.columns]
+        if new:
+            self.columns.extend(dict.fromkeys(new))
+            self._write_sidecar()
+        self._writer.writerows([[_cell(r.get(c, "")) for c in self.columns] for r in rows])
+        self._file.flush()
+        self.rows_written += len(rows)
+        self._unsynced += len(rows)
+        if self.fsync_every and self._unsynced >= self.fsync_every:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        if self.columns != self.header_columns:
+            self._rewrite_header()
+
+    def _rewrite_header(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(self.path, newline="", encoding="utf-8") as src, \
+                open(tmp_path, "w", newline="", encoding="utf-8") as dst:
+            src.readline()
+            csv.writer(dst).writerow(self.columns)
+            shutil.copyfileobj(src, dst)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, self.path)
+        os.remove(_sidecar_path(self.path))
+        self.header_columns = list(self.columns)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_records(path: str) -> tuple:
+    """``(columns, records)`` of the complete rows; cells are parsed with ``_parse_cell``, empty ones are None."""
+    header, columns = _read_columns(path)
+    text, _ = _complete_text(path)
+    reader = csv.reader(io.StringIO(text))
+    next(reader, None)
+    records = []
+    for row in reader:
+        record = dict.fromkeys(columns)
+        for column, value in zip(columns, row):
+            if value != "":
+                record[column] = value if column == ROW_HASH_COLUMN else _parse_cell(value)
+        records.append(record)
+    return columns, records
+
+
+def read_results_csv(path: str):
+    """Load a results CSV as a DataFrame, honouring the sidecar of a run still in progress.
+
+    Cells keep the type they were written with: integer columns stay integer
+    (nullable where some rows lack them) and list cells are lists.
+    """
+    import pandas as pd
+    columns, records = _read_records(path)
+    return pd.DataFrame(records, columns=columns, dtype=object).convert_dtypes(convert_string=False)
+
+
+def completed_results(path: str) -> dict:
+    """``{row hash: result}`` for the rows of a results file that finished without an error.
+
+    Empty cells are left out of the results, as the keys were absent when the
+    rows were first written; the others are parsed back to what was written.
+    """
+    header, columns = _read_columns(path)
+    if ROW_HASH_COLUMN not in columns:
+        return {}
+    done = {}
+    for record in _read_records(path)[1]:
+        key = record.pop(ROW_HASH_COLUMN)
+        if key is None or record.get("Error") is not None:
+            continue
+        done[key] = {k: v for k, v in record.items() if v is not None}
+    return done
+
+
+_BOOLEANS = {"True": True, "False": False}
+
+
+def _parse_cell(value: str):
+    """A CSV cell back as the value that was written: int, float, bool, list/dict or str."""
+    if value in _BOOLEANS:
+        return _BOOLEANS[value]
+    for number in (int, float):
+        try:
+            return number(value)
+        except ValueError:
+            pass
+    # List and dict results (best-match vectors, LLM judge scores) are written as JSON,
+    # by older writers as their Python repr
+    if value[:1] in ("[", "{") and value[-1:] in ("]", "}"):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+        try:
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            pass
+    return value
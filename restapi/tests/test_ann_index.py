@@ -0,0 +1,51 @@
+import numpy as np
+
+import app.services.ann_index as ann_index
+from app.services.ann_index import IVFIndex, get_gold_index
+from app.services.best_match import best_matches
+
+
+def _clustered(rng, centers, n):
+    return centers[rng.integers(0, len(centers), n)] + 0.3 * rng.normal(size=(n, centers.shape[1]))
+
+
+def test_search_finds_the_exact_best_matches():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 16))
+    gold, queries = _clustered(rng, centers, 2000), _clustered(rng, centers, 300)
+    index = IVFIndex.build(gold)
+
+    exact = best_matches(gold, queries)
+    approx = index.best_matches(queries, threshold=0.8)
+    assert index.last_recall >= 0.95
+    assert np.mean(approx.col_arg == exact.col_arg) >= 0.95
+    # Re-ranked scores are exact cosines
+    np.testing.assert_allclose(approx.col_max, exact.col_max, atol=1e-5)
+    covered = exact.row_max >= 0.8
+    assert np.mean((approx.row_max >= 0.8) == covered) >= 0.95
+
+
+def test_low_recall_falls_back_to_exact_search():
+    rng = np.random.default_rng(1)
+    gold, queries = rng.normal(size=(500, 32)), rng.normal(size=(50, 32))
+    index = IVFIndex.build(gold, n_lists=50)
+    result = index.best_matches(queries, min_recall=1.01)
+    np.testing.assert_array_equal(result.col_arg, best_matches(gold, queries).col_arg)
+
+
+def test_gold_index_is_built_once_per_benchmark_and_persisted(tmp_path, monkeypatch):
+    monkeypatch.setattr(ann_index, "ANN_INDEX_ENABLED", True)
+    monkeypatch.setattr(ann_index, "ANN_MIN_GOLD", 10)
+    monkeypatch.setattr(ann_index, "ANN_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(ann_index, "_indexes", {})
+    gold_cqs = [f"Q{i}?" for i in range(100)]
+    embeddings = np.random.default_rng(2).normal(size=(100, 8))
+
+    assert get_gold_index(gold_cqs[:5], embeddings[:5]) is None
+    index = get_gold_index(gold_cqs, embeddings)
+    assert get_gold_index(gold_cqs, embeddings) is index
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+
+    monkeypatch.setattr(ann_index, "_indexes", {})
+    reloaded = get_gold_index(gold_cqs, None)  # loaded from disk, nothing to embed
+    np.testing.assert_array_equal(reloaded.order, index.order)
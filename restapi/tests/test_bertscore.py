@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+bert_utils = pytest.importorskip("bert_score.utils")
+
+from app.services.bertscore import greedy_match_matrices
+
+
+def _random_sentence(rng, dim=16):
+    length = int(rng.integers(3, 9))
+    emb = rng.normal(size=(length, dim)).astype(np.float32)
+    idf = np.ones(length, dtype=np.float32)
+    idf[0] = idf[-1] = 0.0  # [CLS] / [SEP]
+    return emb, idf
+
+
+def _cached(emb, idf):
+    return emb / np.linalg.norm(emb, axis=-1, keepdims=True), idf / idf.sum()
+
+
+def _reference_scores(hyp, ref):
+    """Score one pair with bert_score's own greedy matching."""
+    hyp_emb, hyp_idf = hyp
+    ref_emb, ref_idf = ref
+    P, R, F = bert_utils.greedy_cos_idf(
+        torch.tensor(ref_emb)[None], torch.ones(1, len(ref_idf)), torch.tensor(ref_idf)[None],
+        torch.tensor(hyp_emb)[None], torch.ones(1, len(hyp_idf)), torch.tensor(hyp_idf)[None],
+    )
+    return P.item(), R.item(), F.item()
+
+
+def test_greedy_match_matrices_matches_bert_score():
+    rng = np.random.default_rng(0)
+    hyps = [_random_sentence(rng) for _ in range(5)]
+    refs = [_random_sentence(rng) for _ in range(4)]
+
+    P, R, F1 = greedy_match_matrices([_cached(*h) for h in hyps], [_cached(*r) for r in refs], batch_size=2)
+
+    for i, hyp in enumerate(hyps):
+        for j, ref in enumerate(refs):
+            expected = _reference_scores(hyp, ref)
+            assert np.allclose((P[i, j], R[i, j], F1[i, j]), expected, atol=1e-5)
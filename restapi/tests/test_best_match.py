@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import app.services.hit_rate_evaluator as hit_rate_evaluator
+from app.services.best_match import best_matches, normalize_rows
+
+
+@pytest.mark.parametrize("max_bytes", [4, 64, 1000, 1 << 20])
+def test_blockwise_matches_dense_argmax(max_bytes):
+    rng = np.random.default_rng(1)
+    a, b = rng.normal(size=(37, 8)), rng.normal(size=(53, 8))
+    dense = normalize_rows(a) @ normalize_rows(b).T
+    best = best_matches(a, b, max_bytes=max_bytes)
+    np.testing.assert_allclose(best.row_max, dense.max(axis=1), rtol=1e-5)
+    np.testing.assert_array_equal(best.row_arg, dense.argmax(axis=1))
+    np.testing.assert_allclose(best.col_max, dense.max(axis=0), rtol=1e-5)
+    np.testing.assert_array_equal(best.col_arg, dense.argmax(axis=0))
+
+
+def test_hit_rate_is_the_same_under_a_tiny_memory_budget(monkeypatch):
+    rng = np.random.default_rng(2)
+    vocab = {f"Q{i}?": rng.normal(size=4) for i in range(40)}
+    monkeypatch.setattr(hit_rate_evaluator, "get_sbert_model", lambda: None)
+    monkeypatch.setattr(hit_rate_evaluator, "encode_sentences", lambda cqs, model=None: np.stack([vocab[q] for q in cqs]))
+    monkeypatch.setattr(hit_rate_evaluator, "_generate_gap_cqs", lambda *a, **k: [f"Q{i}?" for i in range(30, 40)])
+    bench, tool = [f"Q{i}?" for i in range(0, 20)], [f"Q{i}?" for i in range(10, 30)]
+
+    results = [hit_rate_evaluator.HitRateEvaluator(threshold=0.5, max_block_bytes=b).compute(bench, tool, "", "gpt-4")
+               for b in (16, 1 << 20)]
+    assert results[0] == results[1]
+
+    dense = normalize_rows(np.stack([vocab[q] for q in bench])) @ normalize_rows(np.stack([vocab[q] for q in tool])).T
+    assert results[0]["covered"] == int((dense.max(axis=1) >= 0.5).sum())
+
+
+def test_hit_rate_encodes_each_set_once_and_accepts_precomputed_embeddings(monkeypatch):
+    rng = np.random.default_rng(3)
+    vocab = {f"Q{i}?": rng.normal(size=4) for i in range(40)}
+    encoded = []
+
+    def encode(cqs, model=None):
+        encoded.append(list(cqs))
+        return np.stack([vocab[q] for q in cqs])
+
+    monkeypatch.setattr(hit_rate_evaluator, "get_sbert_model", lambda: None)
+    monkeypatch.setattr(hit_rate_evaluator, "encode_sentences", encode)
+    monkeypatch.setattr(hit_rate_evaluator, "_generate_gap_cqs", lambda *a, **k: [f"Q{i}?" for i in range(30, 40)])
+    bench, tool = [f"Q{i}?" for i in range(0, 20)], [f"Q{i}?" for i in range(10, 30)]
+    evaluator = hit_rate_evaluator.HitRateEvaluator(threshold=0.9)
+
+    expected = evaluator.compute(bench, tool, "", "gpt-4")
+    assert len(encoded) == 3  # bench, tool, gap
+    encoded.clear()
+    result = evaluator.compute(bench, tool, "", "gpt-4",
+                               bench_embeddings=np.stack([vocab[q] for q in bench]),
+                               tool_embeddings=np.stack([vocab[q] for q in tool]))
+    assert result == expected
+    assert encoded == [[f"Q{i}?" for i in range(30, 40)]]
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+pytest.importorskip("matplotlib")
+pytest.importorskip("seaborn")
+from PIL import Image
+
+from app.services.heatmap_generator import render_heatmap, render_heatmap_image, render_heatmap_png, _PAD, _TITLE_HEIGHT
+
+TOP = _PAD + _TITLE_HEIGHT
+
+
+def _heatmap_pixels(path, side):
+    """The heatmap area (side x side) of a rendered image, without title and legend."""
+    with Image.open(path) as im:
+        return np.asarray(im.convert("RGB"))[TOP:TOP + side, _PAD:_PAD + side], im.info
+
+
+def test_large_matrix_is_rendered_as_bounded_overview(tmp_path):
+    matrix = np.zeros((3000, 700))
+    matrix[1234, 567] = 1.0
+    path = render_heatmap(matrix, "Cosine Similarity Heatmap", str(tmp_path / "big.png"))
+    pixels, info = _heatmap_pixels(path, 512)
+    assert pixels.shape == (512, 512, 3)
+    assert info["Title"] == "Cosine Similarity Heatmap"
+    # Max-pooling keeps the single strong pair: exactly one red pixel
+    assert ((pixels[..., 0] > 150) & (pixels[..., 2] < 100)).sum() == 1
+
+
+def test_small_matrix_is_upscaled_per_cell(tmp_path):
+    matrix = np.array([[0.0, 1.0], [0.5, np.nan]])
+    path = render_heatmap_image(matrix, "t", str(tmp_path / "small.png"))
+    pixels, _ = _heatmap_pixels(path, 32)
+    # One colour per cell: low (blue) top-left, high (red) top-right
+    assert pixels[0, 0, 2] > pixels[0, 0, 0] and pixels[0, 31, 0] > pixels[0, 31, 2]
+    assert len({tuple(p) for p in pixels[:16, :16].reshape(-1, 3)}) == 1
+
+
+def test_colours_use_a_fixed_scale(tmp_path):
+    # Both cells are high scores: red, not stretched to the matrix's own min/max
+    path = render_heatmap_image(np.array([[0.9, 0.95]]), "t", str(tmp_path / "high.png"))
+    pixels, _ = _heatmap_pixels(path, 16)
+    assert pixels[0, 0, 0] > pixels[0, 0, 2]
+
+
+def test_concurrent_renders_of_one_file(tmp_path):
+    path = str(tmp_path / "same.png")
+    matrices = [np.full((3, 3), i / 8) for i in range(8)]
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda m: render_heatmap_png(m, "t", path), matrices))
+        list(pool.map(lambda m: render_heatmap_image(m, "t", path), matrices))
+    assert [p.name for p in tmp_path.iterdir()] == ["same.png"]
+    with Image.open(path) as im:
+        im.verify()
+
+
+def test_identical_heatmaps_are_rendered_once(tmp_path, monkeypatch):
+    import app.services.heatmap_renderer as renderer
+    calls = []
+    monkeypatch.setattr(renderer, "_render", lambda m, title, path: calls.append(path) or open(path, "wb").close() or path)
+    matrix = np.array([[0.1, 0.2], [0.3, 0.4]])
+
+    first = renderer.schedule_heatmap(matrix, "Cosine", str(tmp_path), "cosine_heatmap", mode="sync")
+    again = renderer.schedule_heatmap(matrix.copy(), "Cosine", str(tmp_path), "cosine_heatmap", mode="sync")
+    other = renderer.schedule_heatmap(matrix, "Jaccard", str(tmp_path), "cosine_heatmap", mode="sync")
+
+    assert first == again != other
+    assert calls == [first, other]
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    import os
+    from app.services.heatmap_renderer import evict_heatmaps
+    for i, name in enumerate(["old.png", "mid.npz", "new.png", "notes.txt"]):
+        (tmp_path / name).write_bytes(b"x" * 100)
+        os.utime(tmp_path / name, (1000 + i, 1000 + i))
+
+    assert evict_heatmaps(str(tmp_path), max_bytes=150) == 2
+    assert sorted(os.listdir(tmp_path)) == ["new.png", "notes.txt"]
@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+
+from app.services.matrix_store import DATA_FILE, INDEX_FILE, MatrixStore, MatrixStoreWriter
+
+
+def test_round_trip_by_row_and_project(tmp_path):
+    folder = str(tmp_path / "run")
+    cosine = np.array([[0.9, 0.1, 0.3], [0.2, 0.7, 0.4]])
+    with MatrixStoreWriter(folder) as writer:
+        writer.add(0, ["a?", "b?"], ["x?", "y?", "z?"], {"cosine": cosine, "bleu": cosine / 2}, project="p1")
+        writer.add(1, ["c?"], ["x?"], {"cosine": [[0.5]]}, project="p2")
+
+    store = MatrixStore(folder)
+    assert store.rows() == [0, 1] and store.rows("p2") == [1]
+    assert store.outputs() == ["bleu", "cosine"]
+    np.testing.assert_allclose(store.matrix(0, "bleu"), cosine / 2, rtol=1e-6)
+    np.testing.assert_allclose(store.best_match(0), [0.9, 0.7], rtol=1e-6)
+    assert store.entry(1)["gold"] == ["x?"]
+
+
+def test_append_discards_a_row_cut_short(tmp_path):
+    folder = str(tmp_path / "run")
+    with MatrixStoreWriter(folder) as writer:
+        writer.add(0, ["a?"], ["x?", "y?"], {"cosine": [[0.1, 0.2]]})
+    # Crash while writing row 1: its data is there but its index line is partial
+    with open(os.path.join(folder, DATA_FILE), "ab") as f:
+        f.write(np.zeros(4, dtype=np.float32).tobytes())
+    with open(os.path.join(folder, INDEX_FILE), "a", encoding="utf-8") as f:
+        f.write('{"row": 1, "proj')
+
+    with MatrixStoreWriter(folder, append=True) as writer:
+        writer.add(1, ["b?"], ["x?"], {"cosine": [[0.8]]})
+
+    store = MatrixStore(folder)
+    assert store.rows() == [0, 1]
+    np.testing.assert_allclose(store.matrix(0, "cosine"), [[0.1, 0.2]], rtol=1e-6)
+    np.testing.assert_allclose(store.matrix(1, "cosine"), [[0.8]], rtol=1e-6)
+    assert os.path.getsize(os.path.join(folder, DATA_FILE)) == 3 * 4
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+
+import app.services.metric_registry as metric_registry
+from app.services.pair_score_cache import PairScoreCache
+from app.services.run_results import RunResultStore
+from app.services.text_metrics import bleu_matrix, jaccard_matrix
+
+GENERATED = ["What is the project about?", "Who funds the project?", "What is the project about?"]
+GOLD = ["What is the project about?", "Which organisation funds the project?"]
+
+
+def test_round_trip_and_partial_hits(tmp_path):
+    cache = PairScoreCache(str(tmp_path / "pairs.sqlite3"))
+    matrix = np.array([[0.5, 0.1], [0.2, 0.3], [0.5, 0.1]])
+    cache.put_matrix("bleu", "v1", GENERATED, GOLD, matrix, mask=np.array([[1, 0], [1, 1], [1, 0]], dtype=bool))
+
+    got, found = cache.get_matrix("bleu", "v1", GENERATED + ["New?"], GOLD)
+    # Row 2 repeats row 0's text, so it shares row 0's stored scores
+    assert found.tolist() == [[True, False], [True, True], [True, False], [False, False]]
+    assert got[1].tolist() == [0.2, 0.3]
+    assert got[2, 0] == 0.5 and got[2, 1] == 0.0
+
+    _, found = cache.get_matrix("bleu", "v2", GENERATED, GOLD)
+    assert not found.any()
+
+
+def _register_cached_bleu(monkeypatch, calls):
+    def compute(ctx, outputs):
+        calls.append(ctx)
+        return {"bleu": bleu_matrix(ctx["generated"], ctx["gold"])}
+
+    metric = metric_registry.Metric("cached_bleu", compute, lambda outputs: {}, cost=50, matrix="bleu",
+                                    cache_version="v1")
+    monkeypatch.setitem(metric_registry.METRIC_REGISTRY, metric.name, metric)
+
+
+def test_compute_metric_only_scores_uncached_pairs(tmp_path, monkeypatch):
+    cache = PairScoreCache(str(tmp_path / "pairs.sqlite3"))
+    monkeypatch.setattr(metric_registry, "get_pair_score_cache", lambda: cache)
+    calls = []
+    _register_cached_bleu(monkeypatch, calls)
+
+    ctx = {"generated": GENERATED[:2], "gold": GOLD}
+    first = metric_registry.compute_metric("cached_bleu", ctx, {})["bleu"]
+    ctx = {"generated": GENERATED[:2] + ["Where is it?"], "gold": GOLD}
+    second = metric_registry.compute_metric("cached_bleu", ctx, {})["bleu"]
+    third = metric_registry.compute_metric("cached_bleu", ctx, {})["bleu"]
+
+    assert [c["generated"] for c in calls] == [GENERATED[:2], ["Where is it?"]]
+    assert np.array_equal(first, second[:2])
+    assert np.array_equal(third, bleu_matrix(ctx["generated"], GOLD))
+
+
+def test_unrecorded_blocks_are_not_cached(tmp_path, monkeypatch):
+    cache = PairScoreCache(str(tmp_path / "pairs.sqlite3"))
+    monkeypatch.setattr(metric_registry, "get_pair_score_cache", lambda: cache)
+    calls = []
+    _register_cached_bleu(monkeypatch, calls)
+
+    metric_registry.compute_metric("cached_bleu", {"generated": GENERATED, "gold": GOLD, "record_scores": False}, {})
+    assert cache.stats()["inserts"] == 0
+    assert not metric_registry.METRIC_REGISTRY["bleu"].cache_version
+
+
+def test_run_store_is_consulted_before_computing(monkeypatch):
+    monkeypatch.setattr(metric_registry, "get_pair_score_cache", lambda: None)
+    calls = []
+    metric = metric_registry.Metric(
+        "stored_jaccard", lambda ctx, outputs: calls.append(ctx["generated"]) or {
+            "jaccard": jaccard_matrix(ctx["generated"], ctx["gold"])},
+        lambda outputs: {}, cost=50, matrix="jaccard")
+    monkeypatch.setitem(metric_registry.METRIC_REGISTRY, metric.name, metric)
+
+    store = RunResultStore()
+    for gen, gold in zip(GENERATED, GOLD):
+        metric_registry.compute_metric("stored_jaccard", {"generated": [gen], "gold": [gold], "run_store": store}, {})
+    calls.clear()
+    # Project level: the diagonal pairs were scored by the rows, only the rest is computed and not recorded
+    ctx = {"generated": GENERATED[:2], "gold": GOLD, "run_store": store, "record_scores": False}
+    matrix = metric_registry.compute_metric("stored_jaccard", ctx, {})["jaccard"]
+
+    assert calls == [GENERATED[:2]]
+    assert np.array_equal(matrix, jaccard_matrix(GENERATED[:2], GOLD))
+    assert store.stats()["hits"] == 2
+    assert store.stats()["pairs"] == {"jaccard": 2}
+
+
+def test_cheap_metrics_skip_the_run_store(monkeypatch):
+    monkeypatch.setattr(metric_registry, "get_pair_score_cache", lambda: None)
+    store = RunResultStore()
+    metric_registry.compute_metric("jaccard", {"generated": GENERATED, "gold": GOLD, "run_store": store}, {})
+    assert store.stats()["pairs"] == {}
+
+
+def test_unknown_validation_mode_is_rejected():
+    assert "llm_analysis" not in metric_registry.plan_validation("cosine")["compute"]
+    with pytest.raises(ValueError):
+        metric_registry.plan_validation("cosin")
+
+
+def test_run_store_blocks_and_merge():
+    store = RunResultStore()
+    matrix = np.array([[0.5, 0.1], [0.2, 0.3]])
+    store.put_matrix("cosine", GENERATED[:2], GOLD, matrix, mask=np.array([[1, 0], [1, 1]], dtype=bool))
+    store.put_matrix("cosine", ["New?"], GOLD, np.array([[0.7, 0.8]]))
+
+    got, found = store.get_matrix("cosine", GENERATED + ["New?", "Unknown?"], GOLD[::-1])
+    assert found.tolist() == [[False, True], [True, True], [False, True], [True, True], [False, False]]
+    assert np.allclose(got[1], [0.3, 0.2]) and np.allclose(got[3], [0.8, 0.7])
+
+    # A worker's store, with its own sentence ids, merged back
+    worker = RunResultStore()
+    worker.put_matrix("cosine", ["Other?", GENERATED[0]], GOLD[1:], np.array([[0.4], [0.6]]))
+    store.merge(worker.export(clear=True))
+    got, found = store.get_matrix("cosine", [GENERATED[0], "Other?"], GOLD)
+    assert found.tolist() == [[True, True], [False, True]]
+    assert np.allclose(got, [[0.5, 0.6], [0.0, 0.4]])
+    assert worker.stats()["pairs"] == {}
+
+
+def test_aggregation_counts_whole_cells(tmp_path):
+    import pandas as pd
+    from app.services.cq_validator import CQValidator
+
+    def encode(sentences):
+        return np.array([[len(s), s.count("?"), 1.0] for s in sentences])
+
+    validator = CQValidator(str(tmp_path), validation_mode="cosine", encoder=encode, heatmap_mode="on_demand")
+    df = pd.DataFrame({"Project Name": ["p", "p"], "gold standard": ["What is X? Who is Y?", "How many?"],
+                       "generated": ["What is X?", "How many? Which ones?"]})
+    (group,) = validator.aggregate_dataframe_metrics(df)["by_group"].values()
+    # Multi-question cells stay one unit each, as in the per-project numbers before the run store
+    assert group["num_gold"] == 2 and group["num_generated"] == 2
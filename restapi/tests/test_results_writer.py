@@ -0,0 +1,95 @@
+import csv
+
+import pandas as pd
+
+from app.utils.results_writer import ResultsCSVWriter, ROW_HASH_COLUMN, completed_results, read_results_csv, row_hash
+
+
+def _lines(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_rows_are_appended_in_column_order(tmp_path):
+    path = str(tmp_path / "results.csv")
+    with ResultsCSVWriter(path, ["Gold Standard", "Generated", "BLEU"]) as writer:
+        writer.write_rows([{"BLEU": 0.5, "Generated": "b?", "Gold Standard": "a?"}])
+        assert _lines(path) == [["Gold Standard", "Generated", "BLEU"], ["a?", "b?", "0.5"]]
+        writer.write_rows([{"Gold Standard": "c?", "Generated": "d?"}])
+    assert _lines(path)[2] == ["c?", "d?", ""]
+
+
+def test_new_columns_go_to_the_sidecar_until_close(tmp_path):
+    path = str(tmp_path / "results.csv")
+    writer = ResultsCSVWriter(path, ["Gold Standard", "BLEU"])
+    writer.write_rows([{"Gold Standard": "a?", "BLEU": 0.5}])
+    writer.write_rows([{"Gold Standard": "b?", "Error": "boom"}])
+
+    # Mid-run the header is stale, but the sidecar describes every row
+    assert _lines(path)[0] == ["Gold Standard", "BLEU"]
+    df = read_results_csv(path)
+    assert list(df.columns) == ["Gold Standard", "BLEU", "Error"]
+    assert df["Error"].tolist()[1] == "boom"
+
+    writer.close()
+    assert not (tmp_path / "results.csv.columns.json").exists()
+    df = pd.read_csv(path)
+    assert list(df.columns) == ["Gold Standard", "BLEU", "Error"]
+    assert df["Gold Standard"].tolist() == ["a?", "b?"]
+
+
+def test_append_drops_a_row_cut_short_and_resume_skips_completed_rows(tmp_path):
+    path = str(tmp_path / "results.csv")
+    columns = ["Gold Standard", "Generated", "Best-match Cosines", "Error", ROW_HASH_COLUMN]
+    done, failed = row_hash("a?", "b?", "all", "gpt-4"), row_hash("c?", "d?", "all", "gpt-4")
+    with ResultsCSVWriter(path, columns) as writer:
+        writer.write_rows([
+            {"Gold Standard": "a?", "Generated": "b?", "Best-match Cosines": [0.75], ROW_HASH_COLUMN: done},
+            {"Gold Standard": "c?", "Generated": "d?", "Error": "timeout", ROW_HASH_COLUMN: failed},
+        ])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('e?,"multi\nline')  # crash in the middle of a row
+
+    assert completed_results(path) == {done: {"Gold Standard": "a?", "Generated": "b?", "Best-match Cosines": [0.75]}}
+    assert row_hash("a?", "b?", "all", "gpt-3.5") != done
+
+    with ResultsCSVWriter(path, columns, append=True, drop_failed=True) as writer:
+        writer.write_rows([{"Gold Standard": "c?", "Generated": "d?", ROW_HASH_COLUMN: failed}])
+    assert set(completed_results(path)) == {done, failed}
+    # The failed row was replaced by its re-run, not duplicated
+    assert pd.read_csv(path)["Gold Standard"].tolist() == ["a?", "c?"]
+
+
+def test_hash_covers_metrics_and_dict_cells_round_trip(tmp_path):
+    assert row_hash("a?", "b?", "all", "gpt-4", ["bleu"]) != row_hash("a?", "b?", "all", "gpt-4", ["rouge"])
+    assert row_hash("a?", "b?", "all", "gpt-4", ["bleu", "rouge"]) == row_hash("a?", "b?", "all", "gpt-4",
+                                                                              ["rouge", "bleu"])
+    path = str(tmp_path / "results.csv")
+    judge = [{"Relevance": 4, "Clarity": 5, "Depth": 3, "Average": 4.0}]
+    with ResultsCSVWriter(path, ["Gold Standard", "LLM_as_Judge", ROW_HASH_COLUMN]) as writer:
+        writer.write_rows([{"Gold Standard": "a?", "LLM_as_Judge": judge, ROW_HASH_COLUMN: "h1"}])
+    assert _lines(path)[1][1].startswith('[{"Relevance"')
+    assert completed_results(path)["h1"]["LLM_as_Judge"] == judge
+
+    # Files from older writers hold the Python repr
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow(["b?", repr(judge), "h2"])
+    assert completed_results(path)["h2"]["LLM_as_Judge"] == judge
+
+
+def test_cells_keep_their_types(tmp_path):
+    path = str(tmp_path / "results.csv")
+    columns = ["Gold Standard", "num_gold", "Matches@0.6", "Cosine", ROW_HASH_COLUMN]
+    with ResultsCSVWriter(path, columns) as writer:
+        writer.write_rows([
+            {"Gold Standard": "a?", "num_gold": 3, "Matches@0.6": 2, "Cosine": 0.5, ROW_HASH_COLUMN: "0123"},
+            {"Gold Standard": "b?", "num_gold": 1, "Cosine": 1.0, ROW_HASH_COLUMN: "h2"},
+        ])
+    row = completed_results(path)["0123"]
+    assert row == {"Gold Standard": "a?", "num_gold": 3, "Matches@0.6": 2, "Cosine": 0.5}
+    assert type(row["num_gold"]) is int and type(row["Cosine"]) is float
+    assert "Matches@0.6" not in completed_results(path)["h2"]
+
+    df = read_results_csv(path)
+    assert df["num_gold"].tolist() == [3, 1] and df["num_gold"].dtype.kind == "i"
+    assert df[ROW_HASH_COLUMN].tolist() == ["0123", "h2"]
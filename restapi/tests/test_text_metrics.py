@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from app.services.text_metrics import jaccard_matrix, bleu_matrix, rouge_l_matrix
+
+GENERATED = [
+    "What is the project about?",
+    "Which components does the system have?",
+    "Who funds the project?",
+    "What is the project about?",
+]
+GOLD = [
+    "What is the project about?",
+    "How many components are there?",
+    "Which organisation funds the project and when?",
+    "What are the running components of the project the project runs?",
+    "Who?",
+]
+
+
+def _jaccard(a, b):
+    set1, set2 = set(a.split()), set(b.split())
+    union = len(set1 | set2)
+    return len(set1 & set2) / union if union else 0.0
+
+
+def test_jaccard_matrix_matches_pairwise_sets():
+    expected = np.array([[_jaccard(g, m) for m in GOLD] for g in GENERATED])
+    assert np.array_equal(jaccard_matrix(GENERATED, GOLD), expected)
+
+
+def test_jaccard_matrix_empty_inputs():
+    assert jaccard_matrix([], GOLD).shape == (0, len(GOLD))
+    assert jaccard_matrix(["   "], [""]).tolist() == [[0.0]]
+
+
+def test_bleu_matrix_matches_nltk():
+    bleu = pytest.importorskip("nltk.translate.bleu_score")
+    smooth = bleu.SmoothingFunction().method1
+    expected = np.array([[bleu.sentence_bleu([m.split()], g.split(), smoothing_function=smooth)
+                          for m in GOLD] for g in GENERATED])
+    assert np.allclose(bleu_matrix(GENERATED, GOLD), expected, rtol=0, atol=1e-12)
+
+
+def test_rouge_l_matrix_matches_rouge_score():
+    rouge_scorer = pytest.importorskip("rouge_score.rouge_scorer")
+    scorer = rouge_scorer.RougeScorer(["rougeLsum"], use_stemmer=True)
+    generated = GENERATED + ["What is\nthe project about?"]
+    expected = np.array([[scorer.score(m, g)["rougeLsum"].fmeasure for m in GOLD] for g in generated])
+    assert np.allclose(rouge_l_matrix(generated, GOLD), expected, rtol=0, atol=1e-12)
@@ -0,0 +1,32 @@
+import numpy as np
+
+from app.services.matrix_store import MatrixStoreWriter, run_matrices_folder, save_bench_best_match
+from app.services.threshold_sweep import sweep_best_matches, sweep_coverage, sweep_run, threshold_grid
+
+
+def test_sweep_matches_per_row_precision_at_each_threshold():
+    rng = np.random.default_rng(0)
+    vectors = [rng.random(n) for n in (1, 3, 7, 2)]
+    grid = threshold_grid(0, 1, 21)
+    out = sweep_best_matches(vectors, grid)
+    for i, t in enumerate(grid):
+        assert out["matches"][i] == sum(int((v >= t).sum()) for v in vectors)
+        assert np.isclose(out["precision"][i], np.mean([(v >= t).mean() for v in vectors]), atol=1e-6)
+    assert out["micro_precision"][0] == 1.0 and out["generated_cqs"] == 13
+
+
+def test_coverage_counts_scores_equal_to_the_threshold():
+    assert sweep_coverage([0.2, 0.6, 0.9, 0.6], [0.0, 0.6, 0.61, 1.0]) == [1.0, 0.75, 0.25, 0.0]
+
+
+def test_sweep_run_from_matrix_store(tmp_path):
+    folder = run_matrices_folder(123, str(tmp_path))
+    with MatrixStoreWriter(folder) as writer:
+        writer.add(0, ["a?", "b?"], ["x?"], {"cosine": [[0.7], [0.3]]}, project="p1")
+        writer.add(1, ["c?"], ["x?", "y?"], {"cosine": [[0.1, 0.65]]}, project="p2")
+    save_bench_best_match(folder, [0.7, 0.65, 0.2])
+
+    out = sweep_run(123, [0.6], by_project=True, results_dir=str(tmp_path))
+    assert out["matches"] == [2] and out["precision"] == [0.75]
+    assert out["coverage_rate"] == [round(2 / 3, 6)]
+    assert out["by_project"]["p1"]["precision"] == [0.5]